@@ -0,0 +1,288 @@
+"""
+Timing benchmarks for the rendering and simulation hot paths
+
+Every benchmark runs on fixed seeds with a fixed number of iterations, so results
+are comparable from run to run. Run from the repository root:
+
+    python benchmarks/bench.py                        # everything
+    python benchmarks/bench.py orb particles          # only benchmarks whose name contains a word
+    python benchmarks/bench.py --no-numpy             # the pure-Python paths the web build may use
+    python benchmarks/bench.py --save baseline.json
+    python benchmarks/bench.py --compare baseline.json  # exits with 1 on regressions
+"""
+import argparse
+import gc
+import json
+import os
+import platform
+import random
+import sys
+import time
+
+# Time the drawing code, not a window, and find the assets whatever the working directory
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+os.environ.setdefault('SDL_AUDIODRIVER', 'dummy')
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.chdir(ROOT)
+
+import pygame
+import orbital_pong as op
+
+SEED = 1234
+WARMUP = 20  # Untimed iterations first, so caches and sprite sheets are built
+REGRESSION_THRESHOLD = 0.10  # Fractional p50 slowdown that --compare reports as a regression
+IDLE_SEED = 3  # Its first ball lands on an idle paddle
+IDLE_GAME_TICKS = 4000  # An idle game has to be over by then, a ball stuck on a paddle never ends
+
+def percentile(sorted_values, p):
+    return sorted_values[min(len(sorted_values) - 1, int(p * len(sorted_values)))]
+
+def measure(op_fn, iterations, before=None):
+    """
+    Time op_fn once per iteration, before (untimed) runs ahead of each call
+    Returns the result dict for the report: ops/sec plus p50/p95/p99 milliseconds
+    """
+    for _ in range(WARMUP):
+        if before:
+            before()
+        op_fn()
+
+    times = []
+    gc.collect()
+    gc.disable()  # A collection landing in one run but not the next would swamp the small paths
+    try:
+        for _ in range(iterations):
+            if before:
+                before()
+            start = time.perf_counter()
+            op_fn()
+            times.append(time.perf_counter() - start)
+    finally:
+        gc.enable()
+
+    times.sort()
+    return {
+        'iterations': iterations,
+        'ops_per_sec': iterations / sum(times),
+        'p50_ms': percentile(times, 0.50) * 1000,
+        'p95_ms': percentile(times, 0.95) * 1000,
+        'p99_ms': percentile(times, 0.99) * 1000,
+    }
+
+def make_screen():
+    return pygame.display.set_mode(op.WINDOW_SIZE)
+
+def make_snakes(rng):
+    return [op.Snake(side, rng, op.ParticleSystem()) for side in range(4)]
+
+def bench_orb_sphere(radius):
+    def run():
+        make_screen()  # The texture is converted for the display
+        orb = op.CentralOrb(rng=random.Random(SEED), fx_rng=random.Random(SEED))
+        surface = pygame.Surface((radius * 4, radius * 4), pygame.SRCALPHA)
+        center = (radius * 2, radius * 2)
+        light_pos = (radius * 2 + orb.light_offset[0], radius * 2 + orb.light_offset[1])
+        return measure(lambda: orb.draw_lit_sphere(surface, op.BRIGHT_GREEN, center, radius, light_pos), 100)
+    return run
+
+def bench_light_occlusion():
+    rng = random.Random(SEED)
+    orb = op.CentralOrb(load_texture=False, rng=rng, fx_rng=random.Random(SEED))
+    snakes = make_snakes(rng)
+
+    def before():
+        # Keep the paddles moving, otherwise every call after the first is a cache hit
+        for snake in snakes:
+            snake.move(op.PADDLE_SPEED)
+    return measure(lambda: orb.calculate_light_occlusion(snakes), 500, before)
+
+def bench_snake_shadow():
+    screen = make_screen()
+    snakes = make_snakes(random.Random(SEED))
+
+    def before():
+        # Move every call so the cached shadow is rebuilt each time
+        for snake in snakes:
+            snake.move(op.PADDLE_SPEED)
+
+    def run():
+        for snake in snakes:
+            snake.draw_shadow(screen)
+    return measure(run, 200, before)
+
+def bench_ball_hit_snake():
+    rng = random.Random(SEED)
+    snake = op.Snake(0, rng, op.ParticleSystem())  # Bottom paddle
+    ball = op.Ball(rng, snake.particles)
+    xs = [x for x, y in snake.segments]
+    left, right = min(xs), max(xs)
+    bottom = op.WINDOW_SIZE[1]
+    # Moves heading down at the paddle, some from beside it so misses are timed too
+    moves = []
+    for _ in range(256):
+        x = rng.uniform(left - 60, right + 60)
+        dx = rng.uniform(-5, 5)
+        moves.append(((x, bottom - 60), (x + dx, bottom - 10 - rng.uniform(0, 30))))
+    index = [0]
+
+    def before():
+        prev_pos, pos = moves[index[0] % len(moves)]
+        index[0] += 1
+        ball.prev_pos = list(prev_pos)
+        ball.pos = list(pos)
+        ball.moving_inward = False  # Only outward moving balls are tested against paddles
+        snake.particles.clear()
+    return measure(lambda: ball.hit_snake(snake), 2000, before)
+
+def bench_starfield_update():
+    starfield = op.Starfield(op.NUM_STARS, random.Random(SEED))
+    return measure(starfield.update, 2000)
+
+def bench_starfield_draw(count):
+    def run():
+        screen = make_screen()
+        starfield = op.Starfield(count, random.Random(SEED))
+        return measure(lambda: starfield.draw(screen), 500)
+    return run
+
+def bench_particles(count):
+    def run():
+        rng = random.Random(SEED)
+        particles = op.ParticleSystem(capacity=count)
+        for _ in range(count):
+            velocity = (rng.uniform(-3, 3), rng.uniform(-3, 3))
+            # Long enough to outlive the run, so every update sees the full count
+            particles.emit((rng.uniform(0, op.WINDOW_SIZE[0]), rng.uniform(0, op.WINDOW_SIZE[1])),
+                           velocity, op.WHITE, lifetime=10**9, gravity=0.1, drag=0.98)
+        return measure(particles.update, 200)
+    return run
+
+def bench_game_frame(dirty_rects):
+    def run():
+        scores = op.HighScoreStore(None)  # Keep benchmark games out of the high scores
+        # Simulated time, so the countdown ends after 3 seconds of ticks rather than covering every timed frame
+        game = op.Game(seed=SEED, dirty_rects=dirty_rects, scores=scores, clock=op.VirtualClock())
+
+        def before():
+            if game.game_over:
+                game.reset(SEED, op.VirtualClock())
+            op.surface_pool.begin_frame()
+
+        def frame():
+            game.update(op.PADDLE_SPEED)
+            rects = game.draw()
+            if rects is None:
+                pygame.display.flip()
+            else:
+                pygame.display.update(rects)
+        return measure(frame, 600, before)
+    return run
+
+def bench_game_tick_headless():
+    game = op.Game(headless=True, seed=SEED)
+
+    def before():
+        if game.game_over:
+            game.reset(SEED)
+    return measure(lambda: game.update(op.PADDLE_SPEED), 5000, before)
+
+def bench_game_tick_idle():
+    game = op.Game(headless=True, seed=IDLE_SEED)
+
+    def before():
+        if game.game_over:
+            game.reset(IDLE_SEED)
+        elif game.ticks >= IDLE_GAME_TICKS:
+            raise RuntimeError('idle game still running after %d ticks, is the ball stuck?' % game.ticks)
+    return measure(lambda: game.update(0), 5000, before)
+
+def bench_vector_env(num_envs):
+    def run():
+        import training  # Needs NumPy
+        env = training.VectorEnv(num_envs, seed=SEED)
+        moves = random.Random(SEED).choices((-op.PADDLE_SPEED, 0, op.PADDLE_SPEED), k=num_envs)
+        return measure(lambda: env.step(moves), 500)
+    return run
+
+BENCHMARKS = [
+    ('orb_sphere_r25', bench_orb_sphere(25)),
+    ('orb_sphere_r50', bench_orb_sphere(op.CENTRAL_ORB_RADIUS)),
+    ('orb_sphere_r100', bench_orb_sphere(100)),
+    ('light_occlusion', bench_light_occlusion),
+    ('snake_shadow', bench_snake_shadow),
+    ('ball_hit_snake', bench_ball_hit_snake),
+    ('starfield_update_%d' % op.NUM_STARS, bench_starfield_update),
+    ('starfield_draw_%d' % op.NUM_STARS, bench_starfield_draw(op.NUM_STARS)),
+    ('starfield_draw_%d' % op.STAR_PIXEL_DRAW_MIN, bench_starfield_draw(op.STAR_PIXEL_DRAW_MIN)),
+    ('particles_100', bench_particles(100)),
+    ('particles_1000', bench_particles(1000)),
+    ('particles_10000', bench_particles(10000)),
+    ('game_frame', bench_game_frame(False)),
+    ('game_frame_dirty', bench_game_frame(True)),
+    ('game_tick_headless', bench_game_tick_headless),
+    ('game_tick_idle', bench_game_tick_idle),
+]
+if op.numpy is not None:
+    BENCHMARKS.append(('vector_env_4096', bench_vector_env(4096)))
+
+def compare(results, baseline, threshold):
+    """Print the p50 change against a saved run, returns the names that got slower than threshold"""
+    regressions = []
+    print('\n%-24s %10s %10s %8s' % ('vs baseline', 'p50 ms', 'was', 'change'))
+    for name, result in results.items():
+        old = baseline['results'].get(name)
+        if old is None:
+            continue
+        change = result['p50_ms'] / old['p50_ms'] - 1 if old['p50_ms'] else 0.0
+        flag = '  SLOWER' if change > threshold else ''
+        print('%-24s %10.4f %10.4f %+7.1f%%%s' % (name, result['p50_ms'], old['p50_ms'], change * 100, flag))
+        if flag:
+            regressions.append(name)
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('filters', nargs='*', help='only run benchmarks whose name contains one of these')
+    parser.add_argument('--no-numpy', action='store_true', help='use the pure-Python fallbacks')
+    parser.add_argument('--save', metavar='PATH', help='write the results as JSON')
+    parser.add_argument('--compare', metavar='PATH', help='compare against results saved with --save')
+    parser.add_argument('--threshold', type=float, default=REGRESSION_THRESHOLD,
+                        help='p50 slowdown counted as a regression (default %(default)s)')
+    args = parser.parse_args()
+
+    if args.no_numpy:
+        op.USE_NUMPY = False
+
+    results = {}
+    print('%-24s %8s %12s %10s %10s %10s' % ('benchmark', 'runs', 'ops/sec', 'p50 ms', 'p95 ms', 'p99 ms'))
+    for name, run in BENCHMARKS:
+        if args.filters and not any(word in name for word in args.filters):
+            continue
+        result = run()
+        results[name] = result
+        print('%-24s %8d %12.1f %10.4f %10.4f %10.4f' % (
+            name, result['iterations'], result['ops_per_sec'],
+            result['p50_ms'], result['p95_ms'], result['p99_ms']))
+
+    report = {
+        'python': platform.python_version(),
+        'pygame': pygame.version.ver,
+        'numpy': op.USE_NUMPY,
+        'results': results,
+    }
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(report, f, indent=2)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if baseline.get('numpy') != report['numpy']:
+            print('warning: baseline was recorded with numpy=%s' % baseline.get('numpy'))
+        if compare(results, baseline, args.threshold):
+            return 1
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,10 +1,5 @@
 import asyncio
 import pygame
-import sys
-import math
-import random
-from pygame import Color
-from typing import Tuple, List
 
 # Import your existing game
 from orbital_pong import Game, WINDOW_SIZE
@@ -24,31 +19,15 @@ async def main():
         game = Game()
         print("Game instance created")
         
-        # Main game loop
+        # Main game loop, one frame per tick so the browser gets control back every frame
         running = True
         while running:
-            # Handle events
-            for event in pygame.event.get():
-                if event.type == pygame.QUIT:
-                    running = False
-                elif event.type in (pygame.MOUSEMOTION, pygame.FINGERMOTION):
-                    # Handle both mouse and touch events
-                    if event.type == pygame.FINGERMOTION:
-                        # Convert touch position to mouse position
-                        x = event.x * WINDOW_SIZE[0]
-                        y = event.y * WINDOW_SIZE[1]
-                        game.move_paddles(y)
-                    else:
-                        game.move_paddles(event.pos[1])
-            
-            # Update game state
-            game.run()
-            
-            # Keep the game running at 60 FPS
-            await asyncio.sleep(0)
+            running = await game.tick()
     except Exception as e:
         print(f"Error during game execution: {str(e)}")
         raise
+    finally:
+        pygame.quit()
 
 print("Starting Orbital Pong...")
 asyncio.run(main())
@@ -1,10 +1,26 @@
 import pygame
 import sys
+import os
 import math
 from pygame import Color
 from typing import Tuple, List
 import random
 import time
+import asyncio
+import queue
+import threading
+import csv
+import json
+import struct
+import zlib
+from array import array
+from collections import OrderedDict, deque
+
+# NumPy speeds up the orb renderer but is not available in every pygbag build
+try:
+    import numpy
+except ImportError:
+    numpy = None
 
 # Initialize Pygame and its font system
 pygame.init()
@@ -22,8 +38,40 @@ PADDLE_SPEED = 5
 INITIAL_LIVES = 3
 INITIAL_REPEL_SPEED = 8  # Starting slower
 NUM_STARS = 200
+STAR_PIXEL_DRAW_MIN = 1500  # Star counts from which stamping pixels with NumPy beats one blit per star
 STAR_SPEED = 2
 CENTRAL_ORB_COLOR = (100, 100, 255)  # Blue-ish central orb
+SPHERE_MAP_CACHE_SIZE = 4  # Steady orb plus a few animation radii
+USE_NUMPY = numpy is not None  # Vectorized orb renderer, falls back to per-pixel loops
+ORB_ROTATION_FRAMES = 180  # Pre-shaded orb frames per full turn (2 degrees apart)
+ORB_SHEET_CACHE_SIZE = 2  # Orb sprite sheets kept across games, one per orb radius and light offset
+ORB_SHEET_FILL_BUDGET = 0.002  # Seconds per drawn frame spent shading sprite sheet frames
+ORB_SHADE_CHUNK = 400  # Pixels the pure-Python shader does between budget checks (about 1.5 ms)
+GLOW_CACHE_SIZE = 64  # Pre-rendered glow sprites kept around
+SNAKE_GLOW_CACHE_SIZE = 32  # Snake hit glows, kept apart so their churn can't evict the other glows
+GLOW_ALPHA_STEP = 16  # Fading glow alphas are rounded down to multiples of this, so fades reuse sprites
+TEXT_CACHE_SIZE = 64  # Rendered HUD strings kept around
+DIRTY_RECTS = False  # Redraw and upload only the areas that changed instead of flipping the whole screen
+STAR_LAYER_INTERVAL = 3  # Frames between star redraws in dirty rect mode, each one uploads the whole screen
+PARTICLE_CAPACITY = 2048  # Live particles per game, new ones are dropped beyond this
+BORDER_STEPS_PER_SIDE = 3800  # Border path samples per side, snake points and moves land on this grid
+EVENT_LOG_SIZE = 1000  # Most recent debug events kept while the event log is enabled
+RECORD_REPLAY = False  # Record every game's seed and inputs so it can be played back (F5 saves it)
+REPLAY_CHECKSUM_INTERVAL = 120  # Ticks between state checksums in a replay (2 seconds at 60 FPS)
+REPLAY_MAGIC = b'OPRP'  # File signature and format version of saved replays
+REPLAY_VERSION = 2
+HIGH_SCORE_PATH = 'high_scores.log'  # Score log next to the game, a localStorage key of the same name on the web
+HIGH_SCORE_TOP = 10  # Best scores kept in memory and after compaction
+HIGH_SCORE_COMPACT_EVERY = 50  # Appended scores before the log is rewritten with only the best ones
+SIM_DT = 1 / FPS  # Fixed simulation step in seconds, independent of the render rate
+MAX_SIM_STEPS = 5  # Catch-up steps per rendered frame before the game is allowed to slow down
+PROFILER_WINDOW = 300  # Frames of timings behind the profiler percentiles (5 seconds at 60 FPS)
+PROFILER_TRACE_SIZE = 36000  # Frames kept for trace dumps (10 minutes at 60 FPS)
+PROFILER_OVERLAY_INTERVAL = 30  # Frames between profiler overlay refreshes, rendering text every frame would skew the numbers
+# Profiled phases in frame order, 'frame' is the whole step from input to flip
+PROFILER_PHASES = ('star_update', 'orb_update', 'snake_move', 'ball_move', 'collision',
+                   'star_draw', 'occlusion', 'orb_glow', 'orb_sphere', 'snake_draw',
+                   'ball_draw', 'particle_draw', 'hud', 'flip', 'frame')
 
 # Colors
 WHITE = (255, 255, 255)
@@ -33,27 +81,604 @@ YELLOW = (255, 255, 0)
 DARK_RED = (139, 0, 0)
 NEON_BLUE = (0, 191, 255)
 
-class Ball:
+class SurfacePool:
+    """Reusable scratch surfaces keyed by size and flags, recycled at the start of every frame"""
     def __init__(self):
+        self.free = {}  # (width, height, flags) -> [Surface, ...] not yet handed out this frame
+        self.used = {}  # (width, height, flags) -> [Surface, ...] handed out this frame
+        self.allocations = 0  # New surfaces created this frame
+        self.reuses = 0  # Pooled surfaces handed out this frame
+        self.total_allocations = 0
+        
+    def begin_frame(self):
+        """Return every surface handed out last frame to the pool and reset the frame counters"""
+        for key, surfaces in self.used.items():
+            self.free.setdefault(key, []).extend(surfaces)
+        self.used.clear()
+        self.allocations = 0
+        self.reuses = 0
+        
+    def acquire(self, size, flags=pygame.SRCALPHA):
+        """Get a cleared surface that stays valid until the next begin_frame()"""
+        key = (int(size[0]), int(size[1]), flags)
+        free = self.free.get(key)
+        if free:
+            surface = free.pop()
+            surface.fill((0, 0, 0, 0))
+            self.reuses += 1
+        else:
+            surface = pygame.Surface(key[:2], flags)
+            self.allocations += 1
+            self.total_allocations += 1
+        self.used.setdefault(key, []).append(surface)
+        return surface
+
+class SpriteCache:
+    """LRU cache of pre-rendered sprites keyed by the parameters they were drawn with"""
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self.sprites = OrderedDict()  # key -> Surface
+        self.hits = 0
+        self.misses = 0
+        
+    def get(self, key, render):
+        """Return the sprite for key, calling render() to draw it on a miss"""
+        sprite = self.sprites.get(key)
+        if sprite is None:
+            sprite = render()
+            self.sprites[key] = sprite
+            self.misses += 1
+            while len(self.sprites) > self.max_size:
+                self.sprites.popitem(last=False)
+        else:
+            self.sprites.move_to_end(key)
+            self.hits += 1
+        return sprite
+
+class TextCache(SpriteCache):
+    """LRU cache of rendered strings, font rasterization is one of the slower pygame calls"""
+    def render(self, font, text, color, antialias=True):
+        return self.get((font, text, tuple(color), antialias),
+                        lambda: font.render(text, antialias, color))
+
+class GlyphAtlas:
+    """A font's glyphs for a fixed set of characters on one surface, for strings that change often"""
+    def __init__(self, font, chars, color, antialias=True):
+        glyphs = [font.render(char, antialias, color) for char in chars]
+        self.height = max(glyph.get_height() for glyph in glyphs)
+        self.surface = pygame.Surface((sum(glyph.get_width() for glyph in glyphs), self.height),
+                                      pygame.SRCALPHA)
+        self.rects = {}  # char -> area of the atlas holding its glyph
+        x = 0
+        for char, glyph in zip(chars, glyphs):
+            # Copy the glyph's alpha as is, blending it onto the clear atlas would darken the edges
+            self.surface.blit(glyph, (x, 0), special_flags=pygame.BLEND_RGBA_MAX)
+            self.rects[char] = pygame.Rect(x, 0, glyph.get_width(), glyph.get_height())
+            x += glyph.get_width()
+            
+    def width(self, text):
+        return sum(self.rects[char].width for char in text)
+        
+    def draw(self, screen, text, pos):
+        """Blit text glyph by glyph, no new surface is made however often the text changes, returns its rect"""
+        x, y = pos
+        blits = []
+        for char in text:
+            rect = self.rects[char]
+            blits.append((self.surface, (x, y), rect))
+            x += rect.width
+        screen.blits(blits, doreturn=False)
+        return pygame.Rect(pos[0], pos[1], x - pos[0], self.height)
+
+class WallClock:
+    """Real time, used when a person is playing"""
+    def time(self):
+        return time.time()
+        
+    def advance(self, seconds):
+        pass  # Real time moves on its own
+
+class VirtualClock:
+    """Simulated time that only moves when the game advances it"""
+    def __init__(self, start=0.0):
+        self.now = start
+        
+    def time(self):
+        return self.now
+        
+    def advance(self, seconds):
+        self.now += seconds
+
+class EventLog:
+    """
+    Structured debug events (kind plus named fields), off by default
+    Callers check enabled before emitting, so a disabled log costs one attribute read
+    """
+    def __init__(self, max_events=EVENT_LOG_SIZE):
+        self.enabled = False
+        self.events = deque(maxlen=max_events)  # [(kind, fields), ...] newest last
+        self.sinks = []  # Callables receiving (kind, fields) as events are emitted
+        
+    def enable(self, sink=None):
+        self.enabled = True
+        if sink is not None:
+            self.sinks.append(sink)
+            
+    def disable(self):
+        self.enabled = False
+        self.sinks.clear()
+        
+    def emit(self, kind, **fields):
+        self.events.append((kind, fields))
+        for sink in self.sinks:
+            sink(kind, fields)
+
+def write_varint(out, value):
+    """Append a non-negative int to a bytearray, 7 bits per byte"""
+    while value >= 0x80:
+        out.append(value & 0x7F | 0x80)
+        value >>= 7
+    out.append(value)
+
+def read_varint(data, pos):
+    """Read a varint written by write_varint, returns (value, position after it)"""
+    value = shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        value |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return value, pos
+        shift += 7
+
+def zigzag(value):
+    """Map an int of either sign to a non-negative one for write_varint: 0, -1, 1, -2 -> 0, 1, 2, 3"""
+    return value * 2 if value >= 0 else -value * 2 - 1
+
+def unzigzag(code):
+    """Inverse of zigzag"""
+    return code >> 1 if not code & 1 else -((code + 1) >> 1)
+
+class ReplayRecorder:
+    """
+    Seed, per-tick paddle moves and periodic state checksums of one game
+    Moves are stored as runs of equal values, so holding a key or standing still costs a few bytes
+    """
+    def __init__(self, seed, checksum_interval=REPLAY_CHECKSUM_INTERVAL):
+        self.seed = seed
+        self.checksum_interval = checksum_interval
+        self.runs = []  # [[move, ticks], ...] in tick order
+        self.checksums = []  # State checksum after every checksum_interval ticks
+        
+    def record(self, move, game):
+        """Add the move for the tick the game just simulated"""
+        if self.runs and self.runs[-1][0] == move:
+            self.runs[-1][1] += 1
+        else:
+            self.runs.append([move, 1])
+        if game.ticks % self.checksum_interval == 0:
+            self.checksums.append(game.checksum())
+            
+    def to_bytes(self):
+        """
+        Encode as the magic and version followed by zlib compressed varints: zigzag seed, checksum interval,
+        run count, each run as (ticks, move), checksum count and the checksums as 4 byte little endian ints
+        Integer moves are zigzag encoded with the low bit clear, others are a 1 followed by a double
+        """
+        out = bytearray()
+        write_varint(out, zigzag(self.seed))
+        write_varint(out, self.checksum_interval)
+        write_varint(out, len(self.runs))
+        for move, ticks in self.runs:
+            write_varint(out, ticks)
+            if float(move).is_integer():
+                move = int(move)
+                write_varint(out, zigzag(move) << 1)
+            else:
+                out.append(1)
+                out += struct.pack('<d', move)
+        write_varint(out, len(self.checksums))
+        out += struct.pack('<%dI' % len(self.checksums), *self.checksums)
+        return REPLAY_MAGIC + bytes([REPLAY_VERSION]) + zlib.compress(bytes(out), 9)
+        
+    def save(self, path):
+        with open(path, 'wb') as f:
+            f.write(self.to_bytes())
+        
+    @classmethod
+    def from_bytes(cls, data):
+        if data[:len(REPLAY_MAGIC)] != REPLAY_MAGIC or data[len(REPLAY_MAGIC)] != REPLAY_VERSION:
+            raise ValueError("Not an Orbital Pong replay, or from an unsupported version")
+        data = zlib.decompress(data[len(REPLAY_MAGIC) + 1:])
+        pos = 0
+        seed, pos = read_varint(data, pos)
+        seed = unzigzag(seed)
+        checksum_interval, pos = read_varint(data, pos)
+        replay = cls(seed, checksum_interval)
+        run_count, pos = read_varint(data, pos)
+        for _ in range(run_count):
+            ticks, pos = read_varint(data, pos)
+            code, pos = read_varint(data, pos)
+            if code & 1:
+                move = struct.unpack_from('<d', data, pos)[0]
+                pos += 8
+            else:
+                move = unzigzag(code >> 1)
+            replay.runs.append([move, ticks])
+        count, pos = read_varint(data, pos)
+        replay.checksums = list(struct.unpack_from('<%dI' % count, data, pos))
+        return replay
+        
+    @classmethod
+    def load(cls, path):
+        with open(path, 'rb') as f:
+            return cls.from_bytes(f.read())
+        
+    @property
+    def ticks(self):
+        return sum(ticks for move, ticks in self.runs)
+        
+    def moves(self):
+        """The recorded move for every tick in order"""
+        for move, ticks in self.runs:
+            for _ in range(ticks):
+                yield move
+
+class HighScoreStore:
+    """
+    Final scores kept across sessions, with the best HIGH_SCORE_TOP indexed in memory
+    Each game appends one "score level time" line to a log, which is rewritten with only the
+    best scores every HIGH_SCORE_COMPACT_EVERY games through a temporary file and an atomic
+    rename, so a crash at any point loses at most the line being written. Writes go to a
+    background thread, or on the web build to localStorage once the current frame has ended
+    """
+    def __init__(self, path=HIGH_SCORE_PATH, top_n=HIGH_SCORE_TOP):
+        """path: log file, None keeps scores in memory only"""
+        self.path = path
+        self.top_n = top_n
+        self.top = []  # [(score, level, time), ...] best first
+        self.appended = 0  # Lines in the log beyond the compacted best ones
+        self.torn = False  # The log ends in a line cut short by a crash, rewrite it instead of appending
+        self.loaded = False
+        self.writes = None  # Queue of pending writes, made with the writer thread on first use
+        self.web = sys.platform == 'emscripten'
+        
+    @property
+    def best(self):
+        self.load()
+        return self.top[0][0] if self.top else 0
+        
+    def load(self):
+        """Read the log once, skipping a line torn by a crash"""
+        if self.loaded:
+            return
+        self.loaded = True
+        if self.path is None:
+            return
+        if self.web:
+            import platform  # Pygbag's browser bridge, shadows the standard module on the web build
+            text = platform.window.localStorage.getItem(self.path) or ''
+        else:
+            try:
+                with open(self.path) as f:
+                    text = f.read()
+            except FileNotFoundError:
+                return
+        lines = text.split('\n')
+        self.torn = lines[-1] != ''
+        entries = []
+        for line in lines[:-1]:  # The last one is empty, or torn if it has no newline
+            try:
+                score, level, when = line.split()
+                entries.append((int(score), int(level), float(when)))
+            except ValueError:
+                continue
+        self.appended = max(0, len(entries) - self.top_n)
+        self.index(entries)
+        
+    def index(self, entries):
+        self.top = sorted(self.top + entries, key=lambda entry: entry[0], reverse=True)[:self.top_n]
+        
+    def add(self, score, level):
+        """Record a finished game, the index updates now and the storage later"""
+        self.load()
+        entry = (score, level, time.time())
+        self.index([entry])
+        if self.path is None:
+            return
+        self.appended += 1
+        compact = self.torn or self.appended >= HIGH_SCORE_COMPACT_EVERY
+        if compact:
+            self.appended = 0
+            self.torn = False
+        if self.web:
+            # localStorage has no append, so every write stores just the best scores
+            import platform
+            lines = self.format(self.top)
+            asyncio.get_event_loop().call_soon(platform.window.localStorage.setItem, self.path, lines)
+            return
+        if self.writes is None:
+            self.writes = queue.Queue()
+            threading.Thread(target=self.write_loop, daemon=True).start()
+        self.writes.put(self.format(self.top) if compact else entry)
+        
+    def format(self, entries):
+        return ''.join('%d %d %.3f\n' % entry for entry in entries)
+        
+    def write_loop(self):
+        """Writer thread: append entries, or replace the log when handed the compacted text"""
+        while True:
+            job = self.writes.get()
+            try:
+                if isinstance(job, str):
+                    temp_path = self.path + '.tmp'
+                    with open(temp_path, 'w') as f:
+                        f.write(job)
+                        f.flush()
+                        os.fsync(f.fileno())
+                    os.replace(temp_path, self.path)
+                else:
+                    with open(self.path, 'a') as f:
+                        f.write(self.format([job]))
+                        f.flush()
+                        os.fsync(f.fileno())
+            except OSError as error:
+                # Losing a score is better than taking the game down with it
+                print("Could not save high score: %s" % error)
+            finally:
+                self.writes.task_done()
+                
+    def flush(self):
+        """Wait for pending writes, before the process exits"""
+        if self.writes is not None:
+            self.writes.join()
+
+class FrameProfiler:
+    """
+    Per-phase frame timings with rolling percentiles, off by default (F3 toggles it, F4 dumps a trace)
+    Callers check enabled before timing a phase, so a disabled profiler costs one attribute read
+    """
+    def __init__(self, window=PROFILER_WINDOW, trace_size=PROFILER_TRACE_SIZE):
+        self.enabled = False
+        self.samples = {phase: deque(maxlen=window) for phase in PROFILER_PHASES}  # Milliseconds per frame, newest last
+        self.current = dict.fromkeys(PROFILER_PHASES, 0.0)  # Seconds spent in each phase so far this frame
+        self.starts = {}  # phase -> perf_counter() when it was entered
+        self.counters = {}  # Latest per-frame counts (pool allocations, segment tests, ...)
+        self.trace = deque(maxlen=trace_size)  # One dict of timings and counters per profiled frame
+        self.font = None
+        self.overlay = None  # Rendered overlay text, refreshed every PROFILER_OVERLAY_INTERVAL frames
+        self.overlay_age = 0
+        
+    def enable(self):
+        self.enabled = True
+        self.overlay = None
+        
+    def disable(self):
+        self.enabled = False
+        self.starts.clear()
+        self.current = dict.fromkeys(PROFILER_PHASES, 0.0)
+        
+    def begin(self, phase):
+        self.starts[phase] = time.perf_counter()
+        
+    def end(self, phase):
+        start = self.starts.pop(phase, None)
+        if start is None:
+            return  # Profiler was switched on partway through this phase
+        # Phases entered more than once a frame (catch-up simulation steps) add up
+        self.current[phase] += time.perf_counter() - start
+        
+    def end_frame(self, **counters):
+        """Close the frame, recording every phase (zero if it didn't run) and the given counters"""
+        row = {}
+        for phase in PROFILER_PHASES:
+            ms = self.current[phase] * 1000
+            self.samples[phase].append(ms)
+            row[phase] = ms
+            self.current[phase] = 0.0
+        self.counters = counters
+        row.update(counters)
+        self.trace.append(row)
+        self.overlay_age += 1
+        
+    def percentiles(self, phase):
+        """(p50, p95, p99) in milliseconds over the rolling window"""
+        values = sorted(self.samples[phase])
+        if not values:
+            return (0.0, 0.0, 0.0)
+        last = len(values) - 1
+        return tuple(values[min(last, int(p * len(values)))] for p in (0.50, 0.95, 0.99))
+        
+    def summary(self):
+        return {phase: dict(zip(('p50', 'p95', 'p99'), self.percentiles(phase)))
+                for phase in PROFILER_PHASES}
+        
+    def dump_csv(self, path):
+        """Write the trace as one row per frame"""
+        fields = list(PROFILER_PHASES) + sorted(self.counters)
+        with open(path, 'w', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=fields, extrasaction='ignore')
+            writer.writeheader()
+            writer.writerows(self.trace)
+            
+    def dump_json(self, path):
+        """Write the percentile summary plus the full trace"""
+        with open(path, 'w') as f:
+            json.dump({'summary': self.summary(), 'frames': list(self.trace)}, f)
+            
+    def render_overlay(self):
+        if self.font is None:
+            try:
+                self.font = pygame.font.Font("PressStart2P.ttf", 8)
+            except:
+                self.font = pygame.font.SysFont("Courier New", 12, bold=True)
+        lines = ['%-13s %5s %5s %5s' % ('ms', 'p50', 'p95', 'p99')]
+        for phase in PROFILER_PHASES:
+            lines.append('%-13s %5.2f %5.2f %5.2f' % ((phase,) + self.percentiles(phase)))
+        for name, value in sorted(self.counters.items()):
+            lines.append('%-13s %5d' % (name[:13], value))
+            
+        line_height = self.font.get_linesize()
+        width = max(self.font.size(line)[0] for line in lines)
+        overlay = pygame.Surface((width + 8, line_height * len(lines) + 8), pygame.SRCALPHA)
+        overlay.fill((0, 0, 0, 170))
+        for i, line in enumerate(lines):
+            overlay.blit(self.font.render(line, True, YELLOW), (4, 4 + i * line_height))
+        return overlay
+        
+    def draw(self, screen):
+        if self.overlay is None or self.overlay_age >= PROFILER_OVERLAY_INTERVAL:
+            self.overlay = self.render_overlay()
+            self.overlay_age = 0
+        return screen.blit(self.overlay, (4, 40))
+
+# Shared by every game in the process, so restarts keep the scores
+high_scores = HighScoreStore()
+
+# Shared scratch surfaces for per-frame effects
+surface_pool = SurfacePool()
+glow_cache = SpriteCache(GLOW_CACHE_SIZE)
+snake_glow_cache = SpriteCache(SNAKE_GLOW_CACHE_SIZE)
+orb_sprite_sheets = SpriteCache(ORB_SHEET_CACHE_SIZE)  # OrbSpriteSheet by (radius, light offset)
+event_log = EventLog()
+text_cache = TextCache(TEXT_CACHE_SIZE)
+profiler = FrameProfiler()
+
+class ParticleSystem:
+    """Particles stored as parallel arrays, updated together and drawn in one batch"""
+    def __init__(self, capacity=PARTICLE_CAPACITY, enabled=True):
+        self.capacity = capacity
+        self.enabled = enabled  # Emitters skip their particles entirely when this is False
+        self.count = 0  # Live particles are the first count entries of every array
+        self.palette = []  # Colors, particles store an index into this
+        self.palette_index = {}  # color -> index into palette
+        self.dropped = 0  # Particles not emitted because the system was full
+        
+        if USE_NUMPY:
+            def floats():
+                return numpy.zeros(capacity)
+            def ints():
+                return numpy.zeros(capacity, dtype=numpy.int32)
+        else:
+            def floats():
+                return array('d', bytes(8 * capacity))
+            def ints():
+                return array('i', bytes(4 * capacity))
+        self.x, self.y = floats(), floats()
+        self.vx, self.vy = floats(), floats()
+        self.gravity, self.drag = floats(), floats()
+        self.life, self.color = ints(), ints()
+        self.arrays = (self.x, self.y, self.vx, self.vy, self.gravity, self.drag, self.life, self.color)
+        
+    def emit(self, pos, vel, color, lifetime=30, gravity=0.0, drag=1.0):
+        """Add one particle, returns False if the system is full"""
+        if self.count >= self.capacity:
+            self.dropped += 1
+            return False
+        color_index = self.palette_index.get(color)
+        if color_index is None:
+            color_index = self.palette_index[color] = len(self.palette)
+            self.palette.append(color)
+            
+        i = self.count
+        self.x[i], self.y[i] = pos
+        self.vx[i], self.vy[i] = vel
+        self.gravity[i] = gravity
+        self.drag[i] = drag
+        self.life[i] = lifetime
+        self.color[i] = color_index
+        self.count += 1
+        return True
+        
+    def update(self):
+        """Move every particle one tick and compact out the ones that burned out"""
+        n = self.count
+        if n == 0:
+            return
+        if USE_NUMPY:
+            self.x[:n] += self.vx[:n]
+            self.y[:n] += self.vy[:n]
+            self.vy[:n] += self.gravity[:n]
+            self.vx[:n] *= self.drag[:n]
+            self.vy[:n] *= self.drag[:n]
+            self.life[:n] -= 1
+            alive = self.life[:n] > 0
+            live_count = int(numpy.count_nonzero(alive))
+            if live_count < n:
+                for values in self.arrays:
+                    values[:live_count] = values[:n][alive]
+                self.count = live_count
+        else:
+            x, y, vx, vy = self.x, self.y, self.vx, self.vy
+            gravity, drag, life = self.gravity, self.drag, self.life
+            i = 0
+            while i < n:
+                x[i] += vx[i]
+                y[i] += vy[i]
+                vy[i] += gravity[i]
+                vx[i] *= drag[i]
+                vy[i] *= drag[i]
+                life[i] -= 1
+                if life[i] > 0:
+                    i += 1
+                    continue
+                # Swap the last live particle into this slot and look at it next
+                n -= 1
+                for values in self.arrays:
+                    values[i] = values[n]
+            self.count = n
+            
+    def clear(self):
+        self.count = 0
+        
+    def render_dot(self, color):
+        """Draw the 2px particle dot sprite for a color"""
+        dot = pygame.Surface((5, 5), pygame.SRCALPHA)
+        pygame.draw.circle(dot, color, (2, 2), 2)
+        return dot
+        
+    def draw(self, screen, dirty=False):
+        """Draw every live particle, returns the rect of each one when dirty is set"""
+        n = self.count
+        if n == 0:
+            return []
+        dots = [glow_cache.get(('dot', color), lambda color=color: self.render_dot(color))
+                for color in self.palette]
+        if USE_NUMPY:
+            xs = self.x[:n].astype(int).tolist()
+            ys = self.y[:n].astype(int).tolist()
+            colors = self.color[:n].tolist()
+        else:
+            xs = [int(x) for x in self.x[:n]]
+            ys = [int(y) for y in self.y[:n]]
+            colors = self.color[:n]
+        return screen.blits([(dots[color], (x - 2, y - 2)) for x, y, color in zip(xs, ys, colors)],
+                            doreturn=dirty)
+
+class Ball:
+    def __init__(self, rng=None, particles=None, fx_rng=None):
+        self.rng = rng if rng is not None else random
+        self.fx_rng = fx_rng if fx_rng is not None else random  # For the decorative artifacts only
+        self.particles = particles if particles is not None else ParticleSystem()
         self.center_pos = [WINDOW_SIZE[0] // 2, WINDOW_SIZE[1] // 2]
         self.speed = INITIAL_BALL_SPEED
         self.repel_speed = INITIAL_REPEL_SPEED
+        self.reset_collision_counts()
         self.reset()
         self.color = WHITE
-        self.artifacts = []
-        self.game = None  # Store the game instance
         
     def reset(self):
         # Start from a random position on the border
-        side = random.randint(0, 3)
+        side = self.rng.randint(0, 3)
         if side == 0:  # Bottom
-            self.pos = [random.randint(0, WINDOW_SIZE[0]), WINDOW_SIZE[1]]
+            self.pos = [self.rng.randint(0, WINDOW_SIZE[0]), WINDOW_SIZE[1]]
         elif side == 1:  # Right
-            self.pos = [WINDOW_SIZE[0], random.randint(0, WINDOW_SIZE[1])]
+            self.pos = [WINDOW_SIZE[0], self.rng.randint(0, WINDOW_SIZE[1])]
         elif side == 2:  # Top
-            self.pos = [random.randint(0, WINDOW_SIZE[0]), 0]
+            self.pos = [self.rng.randint(0, WINDOW_SIZE[0]), 0]
         else:  # Left
-            self.pos = [0, random.randint(0, WINDOW_SIZE[1])]
+            self.pos = [0, self.rng.randint(0, WINDOW_SIZE[1])]
+        self.prev_pos = list(self.pos)  # Don't interpolate from where the ball left the screen
             
         # Always aim towards the center initially
         dx = self.center_pos[0] - self.pos[0]
@@ -78,7 +703,7 @@ class Ball:
         
         if self.moving_inward and dist <= BALL_RADIUS:  # Ball reaches center of orb
             # Random new direction away from center
-            angle = random.uniform(0, 2 * math.pi)
+            angle = self.rng.uniform(0, 2 * math.pi)
             self.vel[0] = self.repel_speed * math.cos(angle)
             self.vel[1] = self.repel_speed * math.sin(angle)
             self.moving_inward = False  # Ball is now moving outward
@@ -88,204 +713,353 @@ class Ball:
         self.pos[1] += self.vel[1]
         return False
         
-    def line_collision(self, start, end):
-        """Check collision between ball and line segment"""
+    def closest_point(self, start, end, pos):
+        """Closest point to pos on the line segment from start to end"""
         x1, y1 = start
-        x2, y2 = end
+        line_dx = end[0] - x1
+        line_dy = end[1] - y1
+        line_len_sq = line_dx*line_dx + line_dy*line_dy
+        if line_len_sq == 0:
+            return start
+        # Fraction of the way along the segment, clamped to its ends
+        t = ((pos[0] - x1)*line_dx + (pos[1] - y1)*line_dy) / line_len_sq
+        t = max(0, min(1, t))
+        return (x1 + line_dx*t, y1 + line_dy*t)
         
-        # Calculate closest point on line segment to ball center
-        line_vec = (x2 - x1, y2 - y1)
-        line_len = math.sqrt(line_vec[0]**2 + line_vec[1]**2)
-        if line_len == 0:
-            return False
-            
-        line_unit = (line_vec[0]/line_len, line_vec[1]/line_len)
+    def bounce(self):
+        """Send the ball back toward the center after a paddle hit, returns False if it can't"""
+        # Calculate bounce direction
+        dx = self.center_pos[0] - self.pos[0]
+        dy = self.center_pos[1] - self.pos[1]
+        dist = math.sqrt(dx*dx + dy*dy)
         
-        ball_to_start = (self.pos[0] - x1, self.pos[1] - y1)
-        proj_len = max(0, min(line_len, 
-                            ball_to_start[0]*line_unit[0] + 
-                            ball_to_start[1]*line_unit[1]))
+        if dist > 0:  # Avoid division by zero
+            self.vel = [
+                self.speed * (dx/dist),
+                self.speed * (dy/dist)
+            ]
+            self.moving_inward = True  # Ball is now moving inward
+            return True
+        return False
         
-        closest_point = (x1 + line_unit[0]*proj_len,
-                       y1 + line_unit[1]*proj_len)
+    def sweep_circle(self, from_pos, move, center, radius):
+        """Earliest fraction of move at which from_pos comes within radius of center"""
+        fx = from_pos[0] - center[0]
+        fy = from_pos[1] - center[1]
+        c = fx*fx + fy*fy - radius*radius
+        if c <= 0:
+            return 0.0  # Already touching
+        a = move[0]*move[0] + move[1]*move[1]
+        b = 2 * (move[0]*fx + move[1]*fy)
+        disc = b*b - 4*a*c
+        if a == 0 or disc < 0 or b >= 0:
+            return None  # Not moving, missing or moving away
+        t = (-b - math.sqrt(disc)) / (2*a)
+        return t if t <= 1 else None
         
-        # Check distance to closest point
-        dx = self.pos[0] - closest_point[0]
-        dy = self.pos[1] - closest_point[1]
-        dist = math.sqrt(dx*dx + dy*dy)
+    def sweep_segment(self, start, end, from_pos, move):
+        """
+        Earliest fraction of move at which the ball touches the segment, None if it doesn't
+        The ball is swept as a point against the segment's capsule of radius ball + half paddle
+        """
+        reach = BALL_RADIUS + PADDLE_THICKNESS/2
+        seg_dx = end[0] - start[0]
+        seg_dy = end[1] - start[1]
+        seg_len = math.sqrt(seg_dx*seg_dx + seg_dy*seg_dy)
+        if seg_len == 0:
+            return None
+            
+        # Distance along and across the segment in its own frame
+        ux, uy = seg_dx / seg_len, seg_dy / seg_len
+        rel_x = from_pos[0] - start[0]
+        rel_y = from_pos[1] - start[1]
+        along = rel_x*ux + rel_y*uy
+        across = rel_x*-uy + rel_y*ux
+        move_along = move[0]*ux + move[1]*uy
+        move_across = move[0]*-uy + move[1]*ux
         
-        if dist <= BALL_RADIUS + PADDLE_THICKNESS/2:
-            # Calculate bounce direction
-            dx = self.center_pos[0] - self.pos[0]
-            dy = self.center_pos[1] - self.pos[1]
-            dist = math.sqrt(dx*dx + dy*dy)
+        if abs(across) <= reach and 0 <= along <= seg_len:
+            return 0.0  # Already touching the body
             
-            if dist > 0:  # Avoid division by zero
-                self.vel = [
-                    self.speed * (dx/dist),
-                    self.speed * (dy/dist)
-                ]
-                self.moving_inward = True  # Ball is now moving inward
-                return True
-        return False
+        best = None
+        # Entering through one of the two flat sides of the capsule
+        if move_across != 0 and abs(across) > reach:
+            side = reach if across > 0 else -reach
+            t = (side - across) / move_across
+            if 0 <= t <= 1 and 0 <= along + move_along*t <= seg_len:
+                best = t
+        # Entering through one of the rounded ends
+        for cap in (start, end):
+            t = self.sweep_circle(from_pos, move, cap, reach)
+            if t is not None and (best is None or t < best):
+                best = t
+        return best
+        
+    def reset_collision_counts(self):
+        """Start counting collision tests for a new tick"""
+        self.snake_tests = 0  # Snakes checked against the ball
+        self.segment_tests = 0  # Segments that needed the exact swept test
         
-    def hit_snake(self, segments):
-        """Check for collision with snake segments and handle bounce"""
+    def sweep_snake(self, snake, from_pos, move):
+        """Earliest (fraction of move, segment index) at which the ball touches the snake, or None"""
+        self.snake_tests += 1
+        segments = snake.segments
         if len(segments) < 2:
-            return False
+            return None
             
+        # Broad phase: skip the snake when the ball's whole move can't reach its bounding box
+        reach = BALL_RADIUS + PADDLE_THICKNESS/2
+        min_x = min(from_pos[0], from_pos[0] + move[0]) - reach
+        max_x = max(from_pos[0], from_pos[0] + move[0]) + reach
+        min_y = min(from_pos[1], from_pos[1] + move[1]) - reach
+        max_y = max(from_pos[1], from_pos[1] + move[1]) + reach
+        left, top, right, bottom = snake.bounds
+        if max_x < left or min_x > right or max_y < top or min_y > bottom:
+            return None
+            
+        best = None
         for i in range(len(segments) - 1):
             start = segments[i]
             end = segments[i + 1]
             
+            # Skip segments whose box the move can't reach
+            if ((max_x < start[0] and max_x < end[0]) or
+                (min_x > start[0] and min_x > end[0]) or
+                (max_y < start[1] and max_y < end[1]) or
+                (min_y > start[1] and min_y > end[1])):
+                continue
+            
             # Calculate collision
-            if self.line_collision(start, end):
-                # Set the snake's hit glow to maximum
-                snake = self.find_hit_snake(start)
-                print(f"Hit detected! Found snake: {snake is not None}")  # Debug print
-                if snake:
-                    snake.hit_glow = 1.0
-                    snake.add_impact_effect(start)  # Pass the collision point
-                    print(f"Added impact effect! Segments: {len(snake.segments)}")  # Debug print
-                return True
-        return False
-
-    def find_hit_snake(self, point):
-        """Find which snake was hit based on a point in its segments"""
-        for snake in self.game.snakes:
-            for segment in snake.segments:
-                # Use approximate equality for float comparison
-                if (abs(segment[0] - point[0]) < 1 and 
-                    abs(segment[1] - point[1]) < 1):
-                    return snake
-        return None
+            self.segment_tests += 1
+            t = self.sweep_segment(start, end, from_pos, move)
+            if t is not None and (best is None or t < best[0]):
+                best = (t, i)
+        return best
+        
+    def hit_snakes(self, snakes):
+        """
+        Check the ball's move this tick (from prev_pos to pos) against every snake
+        Returns (snake, contact point) for the earliest hit, with the ball moved back to where it hit
+        """
+        if self.moving_inward:
+            # Already bounced, a ball still touching a paddle must not be bounced again every tick
+            return None
+        from_pos = self.prev_pos
+        # Snakes only run along the border, most moves don't come near enough to test them
+        reach = BALL_RADIUS + PADDLE_THICKNESS/2
+        if (reach < from_pos[0] < WINDOW_SIZE[0] - reach and reach < from_pos[1] < WINDOW_SIZE[1] - reach and
+                reach < self.pos[0] < WINDOW_SIZE[0] - reach and reach < self.pos[1] < WINDOW_SIZE[1] - reach):
+            return None
+        move = (self.pos[0] - from_pos[0], self.pos[1] - from_pos[1])
+        earliest = None
+        for snake in snakes:
+            hit = self.sweep_snake(snake, from_pos, move)
+            if hit is not None and (earliest is None or hit[0] < earliest[0]):
+                earliest = (hit[0], hit[1], snake)
+        if earliest is None:
+            return None
+            
+        # Resolve at the time of impact
+        t, i, snake = earliest
+        impact_pos = [from_pos[0] + move[0]*t, from_pos[1] + move[1]*t]
+        old_pos = self.pos
+        self.pos = impact_pos
+        if not self.bounce():
+            self.pos = old_pos
+            return None
+        contact_point = self.closest_point(snake.segments[i], snake.segments[i + 1], impact_pos)
+        snake.add_impact_effect(contact_point)
+        if event_log.enabled:
+            event_log.emit('snake_hit', side=snake.side, progress=snake.progress,
+                           point=contact_point, segment=i, time_of_impact=t)
+        return snake, contact_point
+        
+    def hit_snake(self, snake):
+        """Check for collision with a snake and handle bounce, returns the contact point on a hit"""
+        hit = self.hit_snakes([snake])
+        return hit[1] if hit else None
         
     def add_artifacts(self, color):
         """Add red artifacts when life is lost"""
+        if not self.particles.enabled:
+            return
         for _ in range(10):
-            angle = random.uniform(0, math.pi * 2)
-            speed = random.uniform(2, 5)
-            velocity = [math.cos(angle) * speed, math.sin(angle) * speed]
-            self.artifacts.append([list(self.pos), velocity, 30, color])  # position, velocity, lifetime, color
+            angle = self.fx_rng.uniform(0, math.pi * 2)
+            speed = self.fx_rng.uniform(2, 5)
+            velocity = (math.cos(angle) * speed, math.sin(angle) * speed)
+            self.particles.emit(self.pos, velocity, color)
 
-    def draw(self, screen):
-        # Draw the main ball with a subtle glow
+    def render_glow(self):
+        """Draw the ball's soft glow sprite"""
         glow_surf = pygame.Surface((BALL_RADIUS*3, BALL_RADIUS*3), pygame.SRCALPHA)
         pygame.draw.circle(glow_surf, (255, 255, 255, 20), 
                          (BALL_RADIUS*1.5, BALL_RADIUS*1.5), BALL_RADIUS*1.2)
-        screen.blit(glow_surf, 
-                   (self.pos[0]-BALL_RADIUS*1.5, self.pos[1]-BALL_RADIUS*1.5))
+        return glow_surf
+
+    def interpolated_pos(self, alpha):
+        """Position between the last two simulation steps, alpha=1 is the latest"""
+        return (self.prev_pos[0] + (self.pos[0] - self.prev_pos[0]) * alpha,
+                self.prev_pos[1] + (self.pos[1] - self.prev_pos[1]) * alpha)
+
+    def draw(self, screen, alpha=1.0):
+        pos = self.interpolated_pos(alpha)
+        
+        # Draw the main ball with a subtle glow
+        glow_surf = glow_cache.get(('ball',), self.render_glow)
+        rect = screen.blit(glow_surf, 
+                           (pos[0]-BALL_RADIUS*1.5, pos[1]-BALL_RADIUS*1.5))
         
         # Draw the main ball
-        pygame.draw.circle(screen, self.color, 
-                         (int(self.pos[0]), int(self.pos[1])), BALL_RADIUS)
+        return rect.union(pygame.draw.circle(screen, self.color, 
+                                             (int(pos[0]), int(pos[1])), BALL_RADIUS))
 
-        # Draw artifacts
-        for artifact in self.artifacts[:]:
-            pos, vel, lifetime, color = artifact
-            pos[0] += vel[0]
-            pos[1] += vel[1]
-            lifetime -= 1
-            if lifetime <= 0:
-                self.artifacts.remove(artifact)
-            alpha = int(255 * (lifetime / 30))
-            pygame.draw.circle(screen, (*color, alpha), (int(pos[0]), int(pos[1])), 2)
+def border_point(side: int, progress: float) -> Tuple[float, float]:
+    """Get x,y coordinates for a point on a given side with given progress"""
+    if side == 0:  # Bottom
+        return (WINDOW_SIZE[0] * progress, WINDOW_SIZE[1])
+    elif side == 1:  # Right
+        return (WINDOW_SIZE[0], WINDOW_SIZE[1] * (1 - progress))
+    elif side == 2:  # Top
+        return (WINDOW_SIZE[0] * (1 - progress), 0)
+    else:  # Left
+        return (0, WINDOW_SIZE[1] * progress)
+
+class BorderPath:
+    """The screen border sampled once as a closed polyline that snakes are sliced out of"""
+    def __init__(self, steps_per_side=BORDER_STEPS_PER_SIDE):
+        self.steps_per_side = steps_per_side
+        self.total_steps = steps_per_side * 4
+        # Index side * steps_per_side + k is progress k / steps_per_side on that side
+        self.points = [border_point(side, k / steps_per_side)
+                       for side in range(4) for k in range(steps_per_side)]
+        
+    def index(self, side, progress):
+        """Nearest path index for a position on the border"""
+        return (side * self.steps_per_side + round(progress * self.steps_per_side)) % self.total_steps
+        
+    def slice(self, side, progress, length, num_points):
+        """num_points evenly spaced points covering length sides from the given position"""
+        start = self.index(side, progress)
+        stride = round(length * self.steps_per_side / (num_points - 1))
+        end = start + stride * (num_points - 1)
+        if end < self.total_steps:
+            points = self.points[start:end + 1:stride]
+        else:
+            points = [self.points[i % self.total_steps] for i in range(start, end + 1, stride)]
+            
+        # Keep the corner when the snake wraps onto the next side instead of cutting across it
+        corner = (start // self.steps_per_side + 1) * self.steps_per_side
+        if corner < end and (corner - start) % stride:
+            points.insert((corner - start) // stride + 1, self.points[corner % self.total_steps])
+        return points
+
+# Shared by every snake, the border never changes
+border_path = BorderPath()
 
 class Snake:
-    def __init__(self, start_side: int):
+    def __init__(self, start_side: int, rng=None, particles=None):
         """
         start_side: 0=bottom, 1=right, 2=top, 3=left
+        rng: random number source for impact sparks, defaults to the random module
+        particles: particle system the sparks go to, defaults to a private one
         """
+        self.rng = rng if rng is not None else random
+        self.particles = particles if particles is not None else ParticleSystem()
         self.side = start_side
         self.progress = 0.25  # Start at 1/4 to center the snake
-        self.segments = []  # List of points defining the snake
         self.is_vertical = (start_side % 2 == 1)  # right/left are odd numbers
         self.snake_length = 0.5  # 50% of border length for portrait mode
-        self.impact_particles = []  # [(pos, vel, lifetime, color), ...]
         self.impact_glow = 0  # Glow intensity from impact
         self.velocity = 0  # Add a velocity attribute
         self.hit_glow = 0  # Add glow timer for hit effect
-        self.generate_segments()
+        self.prev_side = start_side  # Position before the last move, for interpolated drawing
+        self.prev_progress = self.progress
+        self.shadow_key = None  # Position the cached contact shadow was drawn for
+        self.shadow = None  # (sprite, pos), None when no part of the snake is near the orb
+        self.segments_key = None  # Position the cached segments were built for
+        self.segment_cache = None  # (segments, bounds)
         
     def add_impact_effect(self, collision_point):
         """Add impact particles and glow when ball hits"""
         self.hit_glow = 2.0  # Increased initial intensity for sharper effect
+        if not self.particles.enabled:
+            return
         
         # Add spark particles
         num_particles = 15
         for _ in range(num_particles):
-            angle = random.uniform(0, math.pi)  # Semicircle away from paddle
+            angle = self.rng.uniform(0, math.pi)  # Semicircle away from paddle
             if self.side in [0, 2]:  # Top/bottom
                 if self.side == 0:  # Bottom
                     angle += math.pi  # Point upward
-                speed = random.uniform(3, 8)
-                vel = [math.cos(angle) * speed, math.sin(angle) * speed]
+                speed = self.rng.uniform(3, 8)
+                vel = (math.cos(angle) * speed, math.sin(angle) * speed)
             else:  # Left/right
                 if self.side == 1:  # Right
                     angle += math.pi  # Point leftward
-                speed = random.uniform(3, 8)
-                vel = [math.sin(angle) * speed, math.cos(angle) * speed]
+                speed = self.rng.uniform(3, 8)
+                vel = (math.sin(angle) * speed, math.cos(angle) * speed)
             
             # Random bright color for sparks
-            color = random.choice([
+            color = self.rng.choice([
                 (255, 255, 200),  # Bright yellow
                 (255, 200, 150),  # Orange
                 (200, 255, 255),  # Cyan
                 (255, 255, 255)   # White
             ])
             
-            self.impact_particles.append([
-                list(collision_point),  # Position
-                vel,       # Velocity
-                30,       # Lifetime
-                color     # Particle color
-            ])
+            # Lighter gravity and some air resistance
+            self.particles.emit(collision_point, vel, color, gravity=0.1, drag=0.97)
 
     def update_effects(self):
-        """Update impact particles and glow"""
-        # Update particles
-        for particle in self.impact_particles[:]:
-            particle[0][0] += particle[1][0]  # Update x position
-            particle[0][1] += particle[1][1]  # Update y position
-            particle[2] -= 1  # Decrease lifetime
-            
-            # Add gravity to vertical velocity
-            particle[1][1] += 0.2
-            
-            if particle[2] <= 0:
-                self.impact_particles.remove(particle)
-                
+        """Fade the impact and hit glow, sparks are moved by the particle system"""
         # Fade glow
         if self.impact_glow > 0:
             self.impact_glow *= 0.9
+        if self.hit_glow > 0:
+            self.hit_glow = max(0, self.hit_glow - 0.15)  # Fast decay for a sharp flash
         
     def generate_segments(self):
-        self.segments = []
-        num_points = 20  # Number of points per segment for smooth appearance
+        segments = self.build_segments(self.side, self.progress)
+        xs = [x for x, y in segments]
+        ys = [y for x, y in segments]
+        self.segment_cache = (segments, (min(xs), min(ys), max(xs), max(ys)))
+        self.segments_key = (self.side, self.progress)
         
-        # Calculate the snake's body based on current position
-        side = self.side
-        progress = self.progress
+    @property
+    def segments(self):
+        """Points defining the snake, only rebuilt when read after a move"""
+        if self.segments_key != (self.side, self.progress):
+            self.generate_segments()
+        return self.segment_cache[0]
         
-        for i in range(num_points):
-            p = progress + (i / (num_points - 1)) * self.snake_length
-            if p >= 1:  # Wrap to next side
-                p = p - 1
-                side = (self.side + 1) % 4
-            self.segments.append(self.get_point(side, p))
-    
-    def get_point(self, side: int, progress: float) -> Tuple[float, float]:
-        """Get x,y coordinates for a point on a given side with given progress"""
-        if side == 0:  # Bottom
-            return (WINDOW_SIZE[0] * progress, WINDOW_SIZE[1])
-        elif side == 1:  # Right
-            return (WINDOW_SIZE[0], WINDOW_SIZE[1] * (1 - progress))
-        elif side == 2:  # Top
-            return (WINDOW_SIZE[0] * (1 - progress), 0)
-        else:  # Left
-            return (0, WINDOW_SIZE[1] * progress)
+    @property
+    def bounds(self):
+        """(left, top, right, bottom) of the segments, for broad-phase collision checks"""
+        if self.segments_key != (self.side, self.progress):
+            self.generate_segments()
+        return self.segment_cache[1]
+        
+    def build_segments(self, start_side, progress):
+        """Points along the border for a snake whose tail is at progress on start_side"""
+        num_points = 20  # Number of points per segment for smooth appearance
+        return border_path.slice(start_side, progress, self.snake_length, num_points)
+        
+    def interpolated_segments(self, alpha):
+        """Segments between the last two simulation steps, alpha=1 is the latest"""
+        if alpha >= 1 or (self.prev_side, self.prev_progress) == (self.side, self.progress):
+            return self.segments
+        # Interpolate along the border, taking the short way round at a corner
+        start = self.prev_side + self.prev_progress
+        delta = (self.side + self.progress - start + 2) % 4 - 2
+        position = (start + delta * alpha) % 4
+        side = int(position)
+        return self.build_segments(side % 4, position - side)
     
     def move(self, amount: float):
+        self.prev_side = self.side
+        self.prev_progress = self.progress
+        
         # If keys are pressed, set velocity
         if amount != 0:
             self.velocity = amount
@@ -300,154 +1074,527 @@ class Snake:
                 if self.velocity > 0:
                     self.velocity = 0
 
-        # Use velocity for movement
+        if self.velocity == 0:
+            return  # Nothing moved
+            
+        # Use velocity for movement, carrying any overshoot onto the next side
         self.progress += self.velocity / 100.0
         if self.progress >= 1:
-            self.progress = 0
+            self.progress -= 1
             self.side = (self.side + 1) % 4
         elif self.progress < 0:
-            self.progress = 1
+            self.progress += 1
             self.side = (self.side - 1) % 4
-        self.generate_segments()
     
-    def draw(self, screen, color):
+    def render_glow(self, points, alphas):
+        """Draw the layered neon glow for points (relative to the sprite) with one alpha per layer"""
+        width = max(x for x, y in points) + PADDLE_THICKNESS * 2
+        height = max(y for x, y in points) + PADDLE_THICKNESS * 2
+        glow_surface = pygame.Surface((width, height), pygame.SRCALPHA)
+        
+        # Draw multiple layers of glow with decreasing alpha
+        for i, glow_alpha in enumerate(alphas):
+            glow_width = PADDLE_THICKNESS + i * 2  # Slightly thinner glow layers
+            pygame.draw.lines(glow_surface, (*NEON_BLUE, glow_alpha), False, points, glow_width)
+            pygame.draw.circle(glow_surface, (*NEON_BLUE, glow_alpha), points[0], glow_width // 2)
+            pygame.draw.circle(glow_surface, (*NEON_BLUE, glow_alpha), points[-1], glow_width // 2)
+        return glow_surface
+        
+    def draw(self, screen, color, alpha=1.0):
+        """Draw the snake and its hit glow, returns the rect it covered"""
+        segments = self.interpolated_segments(alpha)
+        rects = []
+        
         # Draw glow effect when hit
         if self.hit_glow > 0:
-            # Create a surface for the glow
-            glow_surface = pygame.Surface((WINDOW_SIZE[0], WINDOW_SIZE[1]), pygame.SRCALPHA)
-            
-            # Draw multiple layers of glow with decreasing alpha
-            for i in range(3):
-                glow_alpha = min(255, max(0, int(self.hit_glow * (255 - i * 60))))  # Decrease alpha for outer layers
-                glow_width = PADDLE_THICKNESS + i * 2  # Slightly thinner glow layers
+            points = [tuple(map(int, point)) for point in segments]
+            if len(points) >= 2:
+                # Glow sprite covers the snake's bounding box plus room for the widest layer
+                left = min(x for x, y in points) - PADDLE_THICKNESS
+                top = min(y for x, y in points) - PADDLE_THICKNESS
+                local_points = tuple((x - left, y - top) for x, y in points)
+                alphas = tuple(min(255, max(0, int(self.hit_glow * (255 - i * 60)))) // GLOW_ALPHA_STEP * GLOW_ALPHA_STEP
+                               for i in range(3))  # Decrease alpha for outer layers
+                glow_surface = snake_glow_cache.get(('snake', local_points, alphas),
+                                              lambda: self.render_glow(local_points, alphas))
                 
-                points = [tuple(map(int, point)) for point in self.segments]
-                if len(points) >= 2:
-                    pygame.draw.lines(glow_surface, (*NEON_BLUE, glow_alpha), False, points, glow_width)
-                    pygame.draw.circle(glow_surface, (*NEON_BLUE, glow_alpha), points[0], glow_width // 2)
-                    pygame.draw.circle(glow_surface, (*NEON_BLUE, glow_alpha), points[-1], glow_width // 2)
-            
-            # Blend the glow surface onto the screen
-            screen.blit(glow_surface, (0, 0), special_flags=pygame.BLEND_ALPHA_SDL2)
-            
-            # Faster decrease of the glow timer
-            self.hit_glow = max(0, self.hit_glow - 0.15)  # Increased decay rate
+                # Blend the glow surface onto the screen
+                rects.append(screen.blit(glow_surface, (left, top), special_flags=pygame.BLEND_ALPHA_SDL2))
         
         # Draw the snake segments
-        points = [tuple(map(int, point)) for point in self.segments]
+        points = [tuple(map(int, point)) for point in segments]
         if len(points) >= 2:
             # Use neon blue color while glowing, otherwise use normal color
             current_color = NEON_BLUE if self.hit_glow > 0 else color
-            pygame.draw.lines(screen, current_color, False, points, PADDLE_THICKNESS)
-            pygame.draw.circle(screen, current_color, points[0], PADDLE_THICKNESS // 2)
-            pygame.draw.circle(screen, current_color, points[-1], PADDLE_THICKNESS // 2)
-
-        # Draw impact particles
-        new_particles = []
-        for particle in self.impact_particles[:]:
-            pos, vel, lifetime, particle_color = particle
-            if lifetime > 0:
-                # Update particle position
-                new_pos = [pos[0] + vel[0], pos[1] + vel[1]]
-                # Apply lighter gravity effect
-                vel[1] += 0.1
-                # Reduce velocity (air resistance)
-                vel[0] *= 0.97
-                vel[1] *= 0.97
-                # Calculate alpha based on lifetime
-                alpha = int(255 * (lifetime / 30))
-                # Draw particle
-                pygame.draw.circle(screen, (*particle_color, alpha), 
-                                (int(new_pos[0]), int(new_pos[1])), 2)
-                # Add to new list if still alive
-                new_particles.append([new_pos, vel, lifetime - 1, particle_color])
-        self.impact_particles = new_particles
+            rects.append(pygame.draw.lines(screen, current_color, False, points, PADDLE_THICKNESS))
+            rects.append(pygame.draw.circle(screen, current_color, points[0], PADDLE_THICKNESS // 2))
+            rects.append(pygame.draw.circle(screen, current_color, points[-1], PADDLE_THICKNESS // 2))
+        if not rects:
+            return pygame.Rect(0, 0, 0, 0)
+        return rects[0].unionall(rects[1:])
         
-    def draw_shadow(self, screen):
+    def shadow_dots(self):
+        """Shadow dots (x, y, alpha) cast by the sample points close enough to the orb"""
         # Get orb center and radius
-        orb_center = [WINDOW_SIZE[0] // 2, WINDOW_SIZE[1] // 2]
+        orb_center = (WINDOW_SIZE[0] // 2, WINDOW_SIZE[1] // 2)
         orb_radius = CENTRAL_ORB_RADIUS
-        light_offset = [-orb_radius*1.5, -orb_radius*1.5]  # Match CentralOrb light position
-        light_pos = [orb_center[0] + light_offset[0], orb_center[1] + light_offset[1]]
+        light_offset = (-orb_radius*1.5, -orb_radius*1.5)  # Match CentralOrb light position
+        light_pos = (orb_center[0] + light_offset[0], orb_center[1] + light_offset[1])
+        shadow_len = 20  # Length of shadow
         
-        # Create shadow surface
-        shadow_surf = pygame.Surface((WINDOW_SIZE[0], WINDOW_SIZE[1]), pygame.SRCALPHA)
-        
-        # Draw shadow for each segment
-        for i in range(len(self.segments) - 1):
-            x1, y1 = self.segments[i]
-            x2, y2 = self.segments[i + 1]
+        if USE_NUMPY:
+            # 20 samples per segment, from each point up to (not including) the next
+            segments = numpy.asarray(self.segments, dtype=float)
+            t = numpy.arange(0, 100, 5) / 100
+            samples = (segments[:-1, None, :] +
+                       (segments[1:] - segments[:-1])[:, None, :] * t[None, :, None]).reshape(-1, 2)
+            x, y = samples[:, 0], samples[:, 1]
+            dist = numpy.hypot(x - orb_center[0], y - orb_center[1])
+            near = (dist < orb_radius + PADDLE_THICKNESS) & (dist > 0)
+            if not near.any():
+                return []
+            x, y, dist = x[near], y[near], dist[near]
             
-            # Calculate shadow direction for each point
+            # Push each dot away from the light, fading with distance from the orb
+            shadow_x = (x + (x - light_pos[0]) * shadow_len / dist).astype(int)
+            shadow_y = (y + (y - light_pos[1]) * shadow_len / dist).astype(int)
+            alpha = numpy.minimum(255, (80 * (1 - (dist - orb_radius) / PADDLE_THICKNESS)).astype(int))
+            visible = alpha > 0
+            return list(zip(shadow_x[visible].tolist(), shadow_y[visible].tolist(),
+                            alpha[visible].tolist()))
+        
+        dots = []
+        segments = self.segments
+        for i in range(len(segments) - 1):
+            x1, y1 = segments[i]
+            x2, y2 = segments[i + 1]
             for t in range(0, 100, 5):  # Interpolate between segments
-                # Get point on snake
                 x = x1 + (x2 - x1) * t / 100
                 y = y1 + (y2 - y1) * t / 100
+                dist = math.hypot(x - orb_center[0], y - orb_center[1])
+                if 0 < dist < orb_radius + PADDLE_THICKNESS:
+                    shadow_alpha = min(255, int(80 * (1 - (dist - orb_radius) / PADDLE_THICKNESS)))
+                    if shadow_alpha > 0:
+                        dots.append((int(x + (x - light_pos[0]) * shadow_len / dist),
+                                     int(y + (y - light_pos[1]) * shadow_len / dist),
+                                     shadow_alpha))
+        return dots
+        
+    def render_shadow(self):
+        """Draw the shadow dots onto a sprite just big enough for them, returns (sprite, pos) or None"""
+        dots = self.shadow_dots()
+        if not dots:
+            return None
+        radius = PADDLE_THICKNESS // 2
+        left = min(x for x, y, alpha in dots) - radius
+        top = min(y for x, y, alpha in dots) - radius
+        width = max(x for x, y, alpha in dots) - left + radius + 1
+        height = max(y for x, y, alpha in dots) - top + radius + 1
+        shadow_surf = pygame.Surface((width, height), pygame.SRCALPHA)
+        for x, y, alpha in dots:
+            pygame.draw.circle(shadow_surf, (0, 0, 0, alpha), (x - left, y - top), radius)
+        return shadow_surf, (left, top)
+        
+    def draw_shadow(self, screen):
+        """Blend the snake's contact shadow onto the screen, returns the rect it covered"""
+        # The sprite only changes when the snake moves
+        key = (self.side, self.progress, self.snake_length)
+        if key != self.shadow_key:
+            self.shadow_key = key
+            self.shadow = self.render_shadow()
+        if self.shadow is None:
+            return pygame.Rect(0, 0, 0, 0)
+        shadow_surf, pos = self.shadow
+        return screen.blit(shadow_surf, pos)
+
+class Starfield:
+    """Stars flying outward from the center, stored as arrays and moved together"""
+    def __init__(self, count, rng=None):
+        self.count = count
+        self.rng = rng if rng is not None else random
+        self.center = (WINDOW_SIZE[0] // 2, WINDOW_SIZE[1] // 2)
+        self.dot_offsets = {}  # Star size -> lit pixel offsets in its dot sprite
+        if USE_NUMPY:
+            self.numpy_rng = numpy.random.default_rng(self.rng.randrange(2**32))
+            self.x, self.y = numpy.zeros(count), numpy.zeros(count)
+            self.speed = numpy.zeros(count)
+            self.z = numpy.zeros(count, dtype=numpy.int32)
+            self.size = numpy.zeros(count, dtype=numpy.int32)
+            self.respawn(numpy.ones(count, dtype=bool))
+        else:
+            self.x, self.y = array('d', bytes(8 * count)), array('d', bytes(8 * count))
+            self.speed = array('d', bytes(8 * count))
+            self.z, self.size = array('i', bytes(4 * count)), array('i', bytes(4 * count))
+            for i in range(count):
+                self.reset(i)
                 
-                # Calculate distance to orb center
-                dx = x - orb_center[0]
-                dy = y - orb_center[1]
+    def reset(self, i):
+        """Start star i at a random position"""
+        self.x[i] = self.rng.randint(0, WINDOW_SIZE[0])
+        self.y[i] = self.rng.randint(0, WINDOW_SIZE[1])
+        self.z[i] = self.rng.randint(1, 10)  # Depth for parallax effect
+        self.size[i] = self.rng.randint(1, 3)
+        self.speed[i] = STAR_SPEED * (11 - self.z[i]) / 2  # Farther stars move slower
+        
+    def respawn(self, mask):
+        """Start every star selected by the boolean mask at a random position"""
+        count = int(numpy.count_nonzero(mask))
+        if count == 0:
+            return
+        self.x[mask] = self.numpy_rng.integers(0, WINDOW_SIZE[0], count, endpoint=True)
+        self.y[mask] = self.numpy_rng.integers(0, WINDOW_SIZE[1], count, endpoint=True)
+        self.z[mask] = self.numpy_rng.integers(1, 10, count, endpoint=True)
+        self.size[mask] = self.numpy_rng.integers(1, 3, count, endpoint=True)
+        self.speed[mask] = STAR_SPEED * (11 - self.z[mask]) / 2
+        
+    def update(self):
+        """Move every star outward and respawn the ones that left the screen"""
+        center_x, center_y = self.center
+        if USE_NUMPY:
+            dx = self.x - center_x
+            dy = self.y - center_y
+            dist = numpy.hypot(dx, dy)
+            at_center = dist == 0
+            moving = ~at_center
+            self.x[moving] += dx[moving] / dist[moving] * self.speed[moving]
+            self.y[moving] += dy[moving] / dist[moving] * self.speed[moving]
+            off_screen = ((self.x < 0) | (self.x > WINDOW_SIZE[0]) |
+                          (self.y < 0) | (self.y > WINDOW_SIZE[1]))
+            self.respawn(at_center | off_screen)
+        else:
+            x, y, speed = self.x, self.y, self.speed
+            for i in range(self.count):
+                dx = x[i] - center_x
+                dy = y[i] - center_y
                 dist = math.sqrt(dx*dx + dy*dy)
-                
-                if dist < orb_radius + PADDLE_THICKNESS:
-                    # Calculate shadow direction
-                    shadow_dx = x - light_pos[0]
-                    shadow_dy = y - light_pos[1]
-                    shadow_len = 20  # Length of shadow
+                if dist == 0:
+                    self.reset(i)
+                    continue
+                x[i] += (dx / dist) * speed[i]
+                y[i] += (dy / dist) * speed[i]
+                if x[i] < 0 or x[i] > WINDOW_SIZE[0] or y[i] < 0 or y[i] > WINDOW_SIZE[1]:
+                    self.reset(i)
                     
-                    # Draw shadow segment
-                    shadow_x = x + shadow_dx * shadow_len / dist
-                    shadow_y = y + shadow_dy * shadow_len / dist
+    def render_dot(self, size):
+        """Draw the star sprite for one of the star sizes"""
+        dot = pygame.Surface((size * 2 + 1, size * 2 + 1), pygame.SRCALPHA)
+        pygame.draw.circle(dot, WHITE, (size, size), size)
+        return dot
+        
+    def draw(self, screen):
+        """Draw every star"""
+        dots = {size: glow_cache.get(('star', size), lambda size=size: self.render_dot(size))
+                for size in (1, 2, 3)}
+        if USE_NUMPY and self.count >= STAR_PIXEL_DRAW_MIN and screen.get_bitsize() in (24, 32):
+            self.draw_pixels(screen, dots)
+            return
+        if USE_NUMPY:
+            xs = self.x.astype(int).tolist()
+            ys = self.y.astype(int).tolist()
+            sizes = self.size.tolist()
+        else:
+            xs = [int(x) for x in self.x]
+            ys = [int(y) for y in self.y]
+            sizes = self.size
+        screen.blits([(dots[size], (x - size, y - size)) for x, y, size in zip(xs, ys, sizes)],
+                     doreturn=False)
+        
+    def draw_pixels(self, screen, dots):
+        """Stamp every star's dot shape straight into the screen's pixel array"""
+        width, height = screen.get_size()
+        xs = self.x.astype(numpy.intp)
+        ys = self.y.astype(numpy.intp)
+        pixels = pygame.surfarray.pixels3d(screen)
+        for size, dot in dots.items():
+            selected = self.size == size
+            star_xs, star_ys = xs[selected], ys[selected]
+            if size not in self.dot_offsets:
+                self.dot_offsets[size] = list(zip(*numpy.nonzero(pygame.surfarray.array_alpha(dot))))
+            # One vectorized write per pixel of the dot shape
+            for dot_x, dot_y in self.dot_offsets[size]:
+                px = star_xs + (dot_x - size)
+                py = star_ys + (dot_y - size)
+                on_screen = (px >= 0) & (px < width) & (py >= 0) & (py < height)
+                pixels[px[on_screen], py[on_screen]] = WHITE
+        del pixels
+
+class SphereMap:
+    """Precomputed spherical mapping and lighting for one orb radius and light position"""
+    def __init__(self, size, center, radius, light_pos):
+        self.radius = radius
+        
+        # Only visit pixels that land on the target surface
+        self.x_range = (max(0, int(center[0] - radius)), min(size[0], int(center[0] + radius)))
+        self.y_range = (max(0, int(center[1] - radius)), min(size[1], int(center[1] + radius)))
+        
+        if USE_NUMPY:
+            self.build_arrays(center, radius, light_pos)
+            self.count = len(self.xs)  # Pixels shaded
+        else:
+            self.build_lists(center, radius, light_pos)
+            self.count = len(self.pixels)
+            
+    def build_lists(self, center, radius, light_pos):
+        """Build per-pixel tables as Python lists for the fallback renderer"""
+        self.normals = []  # [(nx, ny, nz), ...] per pixel
+        self.pixels = []  # [(x, y, u, v, diffuse, edge_factor), ...]
+        
+        for y in range(*self.y_range):
+            for x in range(*self.x_range):
+                dx = x - center[0]
+                dy = y - center[1]
+                dist_sq = dx*dx + dy*dy
+                if dist_sq > radius*radius:
+                    continue
                     
-                    # Draw shadow with fade
-                    shadow_alpha = int(80 * (1 - (dist - orb_radius) / PADDLE_THICKNESS))
-                    if shadow_alpha > 0:
-                        pygame.draw.circle(shadow_surf, (0, 0, 0, shadow_alpha), 
-                                        (int(shadow_x), int(shadow_y)), 
-                                        PADDLE_THICKNESS // 2)
+                # Calculate the spherical coordinates
+                nx = dx / radius
+                ny = dy / radius
+                nz_sq = 1 - nx*nx - ny*ny
+                if nz_sq <= 0:
+                    continue
+                nz = math.sqrt(nz_sq)
+                
+                # Calculate texture coordinates with spherical mapping
+                u = 0.5 + math.atan2(nx, nz) / (2 * math.pi)
+                v = 0.5 + math.asin(ny) / math.pi
+                
+                # Calculate lighting
+                lx = light_pos[0] - x
+                ly = light_pos[1] - y
+                lz = radius
+                length = math.sqrt(lx*lx + ly*ly + lz*lz)
+                if length == 0:
+                    continue
+                lx /= length
+                ly /= length
+                lz /= length
+                
+                # Calculate diffuse lighting with edge darkening
+                diffuse = nx*lx + ny*ly + nz*lz
+                edge_factor = math.sqrt(1 - (dist_sq / (radius * radius)))
+                diffuse = max(0.2, min(1.0, diffuse * edge_factor))
+                
+                self.normals.append((nx, ny, nz))
+                self.pixels.append((x, y, u, v, diffuse, edge_factor))
+                
+    def build_arrays(self, center, radius, light_pos):
+        """Build the same tables as flat NumPy arrays for the vectorized renderer"""
+        xs, ys = numpy.meshgrid(numpy.arange(*self.x_range), numpy.arange(*self.y_range),
+                                indexing='ij')
+        xs = xs.ravel()
+        ys = ys.ravel()
+        dx = xs - center[0]
+        dy = ys - center[1]
+        dist_sq = dx*dx + dy*dy
+        nx = dx / radius
+        ny = dy / radius
+        nz_sq = 1 - nx*nx - ny*ny
+        
+        lx = light_pos[0] - xs
+        ly = light_pos[1] - ys
+        lz = radius
+        length = numpy.sqrt(lx*lx + ly*ly + lz*lz)
         
-        # Blend shadow onto screen
-        screen.blit(shadow_surf, (0, 0))
+        # Keep the pixels that the loop renderer would draw
+        inside = (dist_sq <= radius*radius) & (nz_sq > 0) & (length != 0)
+        xs, ys = xs[inside], ys[inside]
+        nx, ny, nz = nx[inside], ny[inside], numpy.sqrt(nz_sq[inside])
+        lx, ly, length = lx[inside], ly[inside], length[inside]
+        
+        self.xs = xs
+        self.ys = ys
+        self.normals = numpy.stack((nx, ny, nz), axis=1)
+        self.u = 0.5 + numpy.arctan2(nx, nz) / (2 * math.pi)
+        self.v = 0.5 + numpy.arcsin(ny) / math.pi
+        
+        diffuse = nx*(lx/length) + ny*(ly/length) + nz*(lz/length)
+        self.edge_factor = numpy.sqrt(1 - (dist_sq[inside] / (radius * radius)))
+        self.diffuse = numpy.clip(diffuse * self.edge_factor, 0.2, 1.0)
 
-class Star:
-    def __init__(self):
-        self.reset()
+class OrbSpriteSheet:
+    """
+    Pre-shaded orb frames at quantized rotation angles, shared by every orb with the same radius and light
+    Frames are shaded a little at a time within a per-frame budget, the nearest shaded one stands in until then
+    """
+    def __init__(self, radius, num_frames, light_pos):
+        self.radius = radius
+        self.num_frames = num_frames
+        self.light_pos = light_pos  # Relative to the frame's top-left corner
+        self.frame_size = radius * 2
+        self.columns = math.ceil(math.sqrt(num_frames))
+        rows = math.ceil(num_frames / self.columns)
+        self.sheet = pygame.Surface((self.columns * self.frame_size, rows * self.frame_size),
+                                    pygame.SRCALPHA)
+        self.filled = [False] * num_frames
+        self.filled_count = 0
+        self.pending = None  # (index, surface, pixels shaded so far) of a frame shaded over several calls
         
-    def reset(self):
-        # Start at random position
-        self.x = random.randint(0, WINDOW_SIZE[0])
-        self.y = random.randint(0, WINDOW_SIZE[1])
-        self.z = random.randint(1, 10)  # Depth for parallax effect
-        self.size = random.randint(1, 3)
-        self.speed = STAR_SPEED * (11 - self.z) / 2  # Farther stars move slower
-        
-    def move(self):
-        # Move star outward from center
-        center_x = WINDOW_SIZE[0] // 2
-        center_y = WINDOW_SIZE[1] // 2
-        dx = self.x - center_x
-        dy = self.y - center_y
-        dist = math.sqrt(dx*dx + dy*dy)
+    def frame_index(self, rotation):
+        return int(rotation / 360 * self.num_frames) % self.num_frames
         
-        if dist == 0:
-            self.reset()
-            return
+    def frame_rect(self, index):
+        return pygame.Rect((index % self.columns) * self.frame_size,
+                           (index // self.columns) * self.frame_size,
+                           self.frame_size, self.frame_size)
+        
+    def fill(self, orb, budget):
+        """Shade missing frames with orb's texture for about budget seconds, at least one step per call"""
+        deadline = time.perf_counter() + budget
+        radius = self.radius
+        while self.filled_count < self.num_frames:
+            if self.pending is None:
+                frame = pygame.Surface((self.frame_size, self.frame_size), pygame.SRCALPHA)
+                self.pending = (self.filled.index(False), frame, 0)
+            index, frame, start = self.pending
+            # NumPy shades a whole frame in about a millisecond, the pixel loop needs it in chunks
+            stop = None if USE_NUMPY else start + ORB_SHADE_CHUNK
+            count = orb.render_sphere(frame, WHITE, (radius, radius), radius, self.light_pos,
+                                      rotation=index * 360 / self.num_frames, pixels=slice(start, stop))
+            if stop is None or stop >= count:
+                # The cell is still fully transparent, so MAX copies the pixels without blending
+                self.sheet.blit(frame, self.frame_rect(index), special_flags=pygame.BLEND_RGBA_MAX)
+                self.filled[index] = True
+                self.filled_count += 1
+                self.pending = None
+            else:
+                self.pending = (index, frame, stop)
+            if time.perf_counter() >= deadline:
+                break
+        
+    def get_frame(self, rotation, orb):
+        """Return the sheet area holding the orb at this rotation, or the closest shaded frame before it"""
+        while not self.filled_count:
+            self.fill(orb, 0)  # There has to be something to show, only the very first frame is shaded in one go
+        index = self.frame_index(rotation)
+        while not self.filled[index]:
+            index = (index - 1) % self.num_frames
+        return self.frame_rect(index)
+
+class LightOcclusion:
+    """Light blocked by the paddles along the orb rim, recomputed only when a snake moves"""
+    def __init__(self, center, radius, light_pos):
+        self.center = center
+        self.radius = radius
+        self.light_pos = light_pos
+        self.values = {angle: 1.0 for angle in range(360)}  # Rim angle -> light factor
+        self.shadow = None  # Darkening overlay for the orb, None while fully lit
+        self.snake_state = None
+        
+        # Rays only travel between the light and the orb, so paddles outside this box can't block
+        self.wedge_rect = (min(light_pos[0], center[0] - radius),
+                           min(light_pos[1], center[1] - radius),
+                           max(light_pos[0], center[0] + radius),
+                           max(light_pos[1], center[1] + radius))
+        
+    def blocking_segments(self, snakes):
+        """Paddle segments whose bounding box overlaps the light-to-orb wedge"""
+        left, top, right, bottom = self.wedge_rect
+        half_width = PADDLE_THICKNESS / 2
+        segments = []
+        for snake in snakes:
+            snake_segments = snake.segments
+            for i in range(len(snake_segments) - 1):
+                x1, y1 = snake_segments[i]
+                x2, y2 = snake_segments[i + 1]
+                if (max(x1, x2) + half_width < left or min(x1, x2) - half_width > right or
+                    max(y1, y2) + half_width < top or min(y1, y2) - half_width > bottom):
+                    continue
+                segments.append((x1, y1, x2, y2))
+        return segments
+        
+    def update(self, snakes):
+        """Recompute occlusion if any snake moved, returns True if it changed"""
+        snake_state = tuple((snake.side, snake.progress) for snake in snakes)
+        if snake_state == self.snake_state:
+            return False
+        self.snake_state = snake_state
+        
+        segments = self.blocking_segments(snakes)
+        values = {}
+        light_pos = self.light_pos
+        
+        # For each point on the orb surface
+        for angle in range(360):
+            occlusion = 0
+            if segments:
+                rad = math.radians(angle)
+                # Point on orb surface
+                px = self.center[0] + math.cos(rad) * self.radius
+                py = self.center[1] + math.sin(rad) * self.radius
+                
+                # Calculate light ray to this point
+                dx = px - light_pos[0]
+                dy = py - light_pos[1]
+                ray_length = math.sqrt(dx*dx + dy*dy)
+                dx, dy = dx/ray_length, dy/ray_length
+                
+                # Check for intersections with paddles
+                for x1, y1, x2, y2 in segments:
+                    paddle_dx = x2 - x1
+                    paddle_dy = y2 - y1
+                    
+                    # Ray-line intersection calculation
+                    denom = dx * paddle_dy - dy * paddle_dx
+                    if abs(denom) > 0.0001:
+                        t1 = ((x1 - light_pos[0]) * paddle_dy - (y1 - light_pos[1]) * paddle_dx) / denom
+                        t2 = ((x1 - light_pos[0]) * dy - (y1 - light_pos[1]) * dx) / denom
+                        
+                        # Ray is unit length, so t1 is the distance to the paddle
+                        if 0 <= t2 <= 1 and 0 < t1 < ray_length:
+                            # Add shadow based on distance from paddle
+                            shadow_strength = 1.0 - min(1.0, abs(t2 - 0.5) * 2)
+                            occlusion = max(occlusion, shadow_strength * 0.7)  # Max 70% darkness
+            
+            values[angle] = 1.0 - occlusion
             
-        # Move star outward
-        self.x += (dx / dist) * self.speed
-        self.y += (dy / dist) * self.speed
-        
-        # Reset if off screen
-        if (self.x < 0 or self.x > WINDOW_SIZE[0] or 
-            self.y < 0 or self.y > WINDOW_SIZE[1]):
-            self.reset()
+        if values == self.values:
+            return False
+        self.values.clear()
+        self.values.update(values)
+        self.shadow = self.build_shadow()
+        return True
+        
+    def build_shadow(self):
+        """Draw the occlusion as dark pie slices over an orb-sized transparent surface"""
+        if all(value >= 1.0 for value in self.values.values()):
+            return None
+            
+        size = int(self.radius * 2)
+        shadow = pygame.Surface((size, size), pygame.SRCALPHA)
+        
+        # Group neighbouring angles with the same darkness into one slice
+        angle = 0
+        while angle < 360:
+            alpha = int(255 * (1 - self.values[angle]))
+            end = angle + 1
+            while end < 360 and int(255 * (1 - self.values[end])) == alpha:
+                end += 1
+            if alpha > 0:
+                points = [(self.radius, self.radius)]
+                for edge_angle in range(angle, end + 1):
+                    rad = math.radians(edge_angle)
+                    points.append((self.radius + math.cos(rad) * self.radius,
+                                   self.radius + math.sin(rad) * self.radius))
+                pygame.draw.polygon(shadow, (0, 0, 0, alpha), points)
+            angle = end
+        return shadow
 
 class CentralOrb:
-    def __init__(self):
+    def __init__(self, load_texture=True, rng=None, fx_rng=None, clock=None, particles=None, texture=None):
+        """
+        rng: random number source for gameplay effects, fx_rng: for screen shake and hit debris
+        clock: time source for the glow pulse, defaults to the wall clock
+        particles: particle system hit debris goes to, defaults to a private one
+        texture: an earlier orb's texture to use instead of loading asteroid.jpg again
+        """
+        self.rng = rng if rng is not None else random
+        self.fx_rng = fx_rng if fx_rng is not None else random
+        self.clock = clock if clock is not None else WallClock()
         self.pos = [WINDOW_SIZE[0] // 2, WINDOW_SIZE[1] // 2]
         self.radius = CENTRAL_ORB_RADIUS
         self.shake_amount = 0
-        self.particles = []
+        self.particles = particles if particles is not None else ParticleSystem()
         self.glow_radius = self.radius
         self.exploding = False
         self.explosion_progress = 0
@@ -456,17 +1603,32 @@ class CentralOrb:
         self.background_color = (0, 0, 20)  # Dark blue start
         self.next_background = None
         self.light_offset = [-self.radius*1.5, -self.radius*1.5]
-        self.light_occlusion = {}
+        self.occlusion = LightOcclusion(self.pos, self.radius,
+                                        [self.pos[0] + self.light_offset[0],
+                                         self.pos[1] + self.light_offset[1]])
+        self.light_occlusion = self.occlusion.values  # Rim angle -> light factor
+        self.sphere_maps = OrderedDict()  # (size, center, radius, light_pos) -> SphereMap
         self.trapped_ball = None
         self.shake_phase = 0
+        self.rotation = 0  # Texture turn in degrees, advanced every tick
+        self.prev_rotation = 0  # Rotation before the last tick, for interpolated drawing
         # Load and prepare moon texture
-        try:
-            self.texture = pygame.image.load("asteroid.jpg").convert_alpha()
-            self.texture = pygame.transform.scale(self.texture, (self.radius * 2, self.radius * 2))
-            self.rotation = 0  # Add rotation tracking
-        except pygame.error:
-            print("Warning: Could not load asteroid.jpg texture")
-            self.texture = None
+        self.texture = texture
+        if load_texture and texture is None:
+            try:
+                self.texture = pygame.image.load("asteroid.jpg").convert_alpha()
+                self.texture = pygame.transform.scale(self.texture, (self.radius * 2, self.radius * 2))
+            except pygame.error:
+                print("Warning: Could not load asteroid.jpg texture")
+                self.texture = None
+            
+        # Steady-state orb frames, lit from the same side as the animated orb and kept across games
+        self.sprite_sheet = None
+        if self.texture:
+            light_pos = (self.radius + self.light_offset[0], self.radius + self.light_offset[1])
+            self.sprite_sheet = orb_sprite_sheets.get(
+                (self.radius, tuple(self.light_offset)),
+                lambda: OrbSpriteSheet(self.radius, ORB_ROTATION_FRAMES, light_pos))
 
     def trap_ball(self, ball):
         self.trapped_ball = ball
@@ -474,6 +1636,8 @@ class CentralOrb:
         self.shake_phase = 0
         
     def update(self):
+        self.prev_rotation = self.rotation
+        self.rotation = (self.rotation + 0.2) % 360  # Degrees per tick
         if self.trapped_ball:
             # Orbit the ball around the center while shaking
             self.shake_phase += 0.2
@@ -492,16 +1656,8 @@ class CentralOrb:
                 self.shake_amount *= 0.9
                 
             # Update glow
-            self.glow_radius = self.radius + 5 * math.sin(time.time() * 4)
+            self.glow_radius = self.radius + 5 * math.sin(self.clock.time() * 4)
             
-            # Update particles
-            for particle in self.particles[:]:
-                particle[0][0] += particle[1][0]  # x position
-                particle[0][1] += particle[1][1]  # y position
-                particle[2] -= 1  # lifetime
-                if particle[2] <= 0:
-                    self.particles.remove(particle)
-                    
             # Handle explosion animation
             if self.exploding:
                 self.explosion_progress += 0.02
@@ -523,299 +1679,350 @@ class CentralOrb:
         self.explosion_progress = 0
         # Generate a new dark background color for next level
         self.next_background = (
-            random.randint(0, 20),  # Dark red
-            random.randint(0, 20),  # Dark green
-            random.randint(20, 40)  # Slightly more blue for space feel
+            self.rng.randint(0, 20),  # Dark red
+            self.rng.randint(0, 20),  # Dark green
+            self.rng.randint(20, 40)  # Slightly more blue for space feel
         )
         
     def start_implosion(self):
         self.imploding = True
         self.implosion_progress = 0
         
-    def hit(self):
+    def hit(self, color):
         self.shake_amount = 10
+        if not self.particles.enabled:
+            return
         # Add particles
         for _ in range(10):
-            angle = random.uniform(0, math.pi * 2)
-            speed = random.uniform(2, 5)
-            velocity = [math.cos(angle) * speed, math.sin(angle) * speed]
-            self.particles.append([list(self.pos), velocity, 30])  # position, velocity, lifetime
+            angle = self.fx_rng.uniform(0, math.pi * 2)
+            speed = self.fx_rng.uniform(2, 5)
+            velocity = (math.cos(angle) * speed, math.sin(angle) * speed)
+            self.particles.emit(self.pos, velocity, tuple(color))
 
     def calculate_light_occlusion(self, snakes):
-        """Calculate how much light is blocked by each paddle"""
-        self.light_occlusion.clear()
-        light_pos = [self.pos[0] + self.light_offset[0], 
-                    self.pos[1] + self.light_offset[1]]
-        
-        # For each point on the orb surface
-        for angle in range(360):
-            rad = math.radians(angle)
-            # Point on orb surface
-            px = self.pos[0] + math.cos(rad) * self.radius
-            py = self.pos[1] + math.sin(rad) * self.radius
-            
-            # Calculate light ray to this point
-            dx = px - light_pos[0]
-            dy = py - light_pos[1]
-            ray_length = math.sqrt(dx*dx + dy*dy)
-            dx, dy = dx/ray_length, dy/ray_length
-            
-            # Check for intersections with paddles
-            occlusion = 0
-            for snake in snakes:
-                for i in range(len(snake.segments) - 1):
-                    x1, y1 = snake.segments[i]
-                    x2, y2 = snake.segments[i + 1]
-                    
-                    # Check if ray intersects paddle segment
-                    paddle_dx = x2 - x1
-                    paddle_dy = y2 - y1
-                    
-                    # Ray-line intersection calculation
-                    denom = dx * paddle_dy - dy * paddle_dx
-                    if abs(denom) > 0.0001:
-                        t1 = ((x1 - light_pos[0]) * paddle_dy - (y1 - light_pos[1]) * paddle_dx) / denom
-                        t2 = ((x1 - light_pos[0]) * dy - (y1 - light_pos[1]) * dx) / denom
-                        
-                        if 0 <= t2 <= 1 and t1 > 0:  # Check if intersection is within segment
-                            # Calculate distance-based occlusion
-                            ix = light_pos[0] + dx * t1
-                            iy = light_pos[1] + dy * t1
-                            dist_to_intersection = math.sqrt((ix-light_pos[0])**2 + (iy-light_pos[1])**2)
-                            dist_to_point = math.sqrt((px-light_pos[0])**2 + (py-light_pos[1])**2)
-                            
-                            if dist_to_intersection < dist_to_point:
-                                # Add shadow based on distance from paddle
-                                shadow_strength = 1.0 - min(1.0, abs(t2 - 0.5) * 2)
-                                occlusion = max(occlusion, shadow_strength * 0.7)  # Max 70% darkness
-            
-            self.light_occlusion[angle] = 1.0 - occlusion
+        """Update how much light is blocked by each paddle, returns True if it changed"""
+        return self.occlusion.update(snakes)
     
-    def draw_lit_sphere(self, surface, base_color, center, radius, light_pos, alpha=255):
-        if self.texture and radius > 0:
-            # Create the main surface for our sphere
-            sphere_surface = pygame.Surface((int(radius * 2), int(radius * 2)), pygame.SRCALPHA)
+    def get_sphere_map(self, size, center, radius, light_pos):
+        """Get the cached sphere map for this radius and light, building it if needed"""
+        key = (tuple(size), tuple(center), radius, tuple(light_pos))
+        sphere_map = self.sphere_maps.get(key)
+        if sphere_map is None:
+            sphere_map = SphereMap(size, center, radius, light_pos)
+            self.sphere_maps[key] = sphere_map
+            # Explosion/implosion radii are only seen once, so drop the oldest
+            while len(self.sphere_maps) > SPHERE_MAP_CACHE_SIZE:
+                self.sphere_maps.popitem(last=False)
+        else:
+            self.sphere_maps.move_to_end(key)
+        return sphere_map
+
+    def interpolated_rotation(self, alpha):
+        """Rotation between the last two simulation steps, alpha=1 is the latest"""
+        return (self.prev_rotation + (self.rotation - self.prev_rotation) % 360 * alpha) % 360
+        
+    def draw_lit_sphere(self, surface, base_color, center, radius, light_pos, alpha=255, rotation=0):
+        self.render_sphere(surface, base_color, center, radius, light_pos, alpha, rotation)
             
+    def render_sphere(self, surface, base_color, center, radius, light_pos, alpha=255, rotation=0,
+                      pixels=slice(None)):
+        """
+        Shade the sphere onto surface with the texture turned to the given rotation
+        pixels: slice of the sphere's pixels to shade, to spread one sphere over several calls
+        Returns how many pixels the whole sphere has
+        """
+        if radius <= 0:
+            return 0
+        sphere_map = self.get_sphere_map(surface.get_size(), center, radius, light_pos)
+        
+        texture = None
+        if self.texture:
             # Scale texture slightly larger to avoid edge artifacts
             scaled_size = int(radius * 2.2)  # 10% larger
             scaled_texture = pygame.transform.scale(self.texture, (scaled_size, scaled_size))
+            texture = pygame.transform.rotate(scaled_texture, rotation)
             
-            # Rotate the scaled texture
-            self.rotation = (self.rotation + 0.2) % 360
-            rotated_texture = pygame.transform.rotate(scaled_texture, self.rotation)
+        if USE_NUMPY:
+            self.draw_sphere_numpy(surface, sphere_map, texture, base_color, alpha, pixels)
+        else:
+            self.draw_sphere_python(surface, sphere_map.pixels[pixels], texture, base_color, alpha)
+        return sphere_map.count
             
-            # Get the center position for the rotated texture
-            rot_rect = rotated_texture.get_rect()
-            texture_x = radius - rot_rect.width // 2
-            texture_y = radius - rot_rect.height // 2
+    def draw_sphere_numpy(self, surface, sphere_map, texture, base_color, alpha, pixels=slice(None)):
+        """Shade the sphere's pixels with array operations straight into the surface pixels"""
+        xs, ys = sphere_map.xs[pixels], sphere_map.ys[pixels]
+        diffuse = sphere_map.diffuse[pixels, None]
+        edge_factor = sphere_map.edge_factor[pixels]
+        if texture:
+            width, height = texture.get_size()
+            tx = (sphere_map.u[pixels] * width).astype(numpy.intp)
+            ty = (sphere_map.v[pixels] * height).astype(numpy.intp)
+            valid = (tx >= 0) & (tx < width) & (ty >= 0) & (ty < height)
+            xs, ys, tx, ty = xs[valid], ys[valid], tx[valid], ty[valid]
             
-            # Draw the texture with spherical distortion
-            for y in range(int(center[1] - radius), int(center[1] + radius)):
-                for x in range(int(center[0] - radius), int(center[0] + radius)):
-                    dx = x - center[0]
-                    dy = y - center[1]
-                    dist_sq = dx*dx + dy*dy
-                    
-                    if dist_sq <= radius*radius:
-                        # Calculate the spherical coordinates
-                        nx = dx / radius
-                        ny = dy / radius
-                        nz_sq = 1 - nx*nx - ny*ny
-                        
-                        if nz_sq <= 0:
-                            continue
-                            
-                        nz = math.sqrt(nz_sq)
-                        
-                        # Calculate texture coordinates with spherical mapping
-                        u = 0.5 + math.atan2(nx, nz) / (2 * math.pi)
-                        v = 0.5 + math.asin(ny) / math.pi
-                        
-                        # Sample the texture at the spherical coordinates
-                        tx = int(u * rotated_texture.get_width())
-                        ty = int(v * rotated_texture.get_height())
-                        
-                        try:
-                            if 0 <= tx < rotated_texture.get_width() and 0 <= ty < rotated_texture.get_height():
-                                # Sample the texture
-                                color = rotated_texture.get_at((tx, ty))
-                                
-                                # Calculate lighting
-                                lx = light_pos[0] - x
-                                ly = light_pos[1] - y
-                                lz = radius
-                                length = math.sqrt(lx*lx + ly*ly + lz*lz)
-                                if length == 0:
-                                    continue
-                                    
-                                lx /= length
-                                ly /= length
-                                lz /= length
-                                
-                                # Calculate diffuse lighting with edge darkening
-                                diffuse = nx*lx + ny*ly + nz*lz
-                                edge_factor = math.sqrt(1 - (dist_sq / (radius * radius)))
-                                diffuse = max(0.2, min(1.0, diffuse * edge_factor))
-                                
-                                # Apply lighting
-                                lit_color = (
-                                    int(color[0] * diffuse),
-                                    int(color[1] * diffuse),
-                                    int(color[2] * diffuse),
-                                    int(color[3] * edge_factor)
-                                )
-                                surface.set_at((x, y), lit_color)
-                        except:
-                            continue
+            # Gather the texture with the precomputed spherical mapping
+            texture_rgb = pygame.surfarray.pixels3d(texture)
+            texture_alpha = pygame.surfarray.pixels_alpha(texture)
+            rgb = texture_rgb[tx, ty] * diffuse[valid]
+            alphas = texture_alpha[tx, ty] * edge_factor[valid]
+            del texture_rgb, texture_alpha
+        else:
+            rgb = numpy.array(base_color[:3], dtype=float) * diffuse
+            alphas = alpha * edge_factor
+            
+        # Write through views of the surface, released before it is blitted
+        surface_rgb = pygame.surfarray.pixels3d(surface)
+        surface_alpha = pygame.surfarray.pixels_alpha(surface)
+        surface_rgb[xs, ys] = rgb.astype(numpy.uint8)
+        surface_alpha[xs, ys] = alphas.astype(numpy.uint8)
+        del surface_rgb, surface_alpha
+            
+    def draw_sphere_python(self, surface, pixels, texture, base_color, alpha):
+        """Shade SphereMap.pixels entries one by one, used when NumPy is unavailable"""
+        surface.lock()
+        if texture:
+            width, height = texture.get_size()
+            
+            # Gather the texture with the precomputed spherical mapping
+            texture.lock()
+            for x, y, u, v, diffuse, edge_factor in pixels:
+                tx = int(u * width)
+                ty = int(v * height)
+                if 0 <= tx < width and 0 <= ty < height:
+                    color = texture.get_at((tx, ty))
+                    surface.set_at((x, y), (
+                        int(color[0] * diffuse),
+                        int(color[1] * diffuse),
+                        int(color[2] * diffuse),
+                        int(color[3] * edge_factor)
+                    ))
+            texture.unlock()
         else:
             # Fallback to original sphere drawing if texture is not available
-            for y in range(int(center[1] - radius), int(center[1] + radius)):
-                for x in range(int(center[0] - radius), int(center[0] + radius)):
-                    dx = x - center[0]
-                    dy = y - center[1]
-                    dist_sq = dx*dx + dy*dy
-                    if dist_sq <= radius*radius:
-                        nx = dx / radius
-                        ny = dy / radius
-                        nz_sq = 1 - nx*nx - ny*ny
-                        if nz_sq <= 0:
-                            continue
-                        nz = math.sqrt(nz_sq)
-                        
-                        lx = light_pos[0] - x
-                        ly = light_pos[1] - y
-                        lz = radius
-                        length = math.sqrt(lx*lx + ly*ly + lz*lz)
-                        if length == 0:
-                            continue
-                        lx /= length
-                        ly /= length
-                        lz /= length
-                        
-                        diffuse = nx*lx + ny*ly + nz*lz
-                        edge_factor = math.sqrt(1 - (dist_sq / (radius * radius)))
-                        diffuse = max(0.2, min(1.0, diffuse * edge_factor))
-                        
-                        color = (
-                            int(base_color[0] * diffuse),
-                            int(base_color[1] * diffuse),
-                            int(base_color[2] * diffuse),
-                            int(alpha * edge_factor)
-                        )
-                        surface.set_at((x, y), color)
+            for x, y, u, v, diffuse, edge_factor in pixels:
+                surface.set_at((x, y), (
+                    int(base_color[0] * diffuse),
+                    int(base_color[1] * diffuse),
+                    int(base_color[2] * diffuse),
+                    int(alpha * edge_factor)
+                ))
+        surface.unlock()
     
-    def draw(self, screen, color, snakes):
+    def render_glow(self, radius, color):
+        """Draw the three-ring orb glow sprite for a glow radius"""
+        glow_surf = pygame.Surface((radius * 4, radius * 4), pygame.SRCALPHA)
+        for i in range(3):
+            glow_radius = radius * (3 - i) / 3
+            alpha = 60 - i * 20  # Reduced glow intensity
+            pygame.draw.circle(glow_surf, (*color, alpha), 
+                             (radius * 2, radius * 2), 
+                             glow_radius)
+        return glow_surf
+        
+    def draw(self, screen, color, snakes, alpha=1.0):
+        """
+        Draw the glow, orb and paddle shadows, returns the rect they covered
+        alpha: how far between the last two simulation steps to draw the rotation (0-1)
+        """
+        profiling = profiler.enabled
         # Update light occlusion based on paddle positions
+        if profiling:
+            profiler.begin('occlusion')
         self.calculate_light_occlusion(snakes)
+        if profiling:
+            profiler.end('occlusion')
         
         # Calculate shake offset
-        shake_x = random.uniform(-self.shake_amount, self.shake_amount)
-        shake_y = random.uniform(-self.shake_amount, self.shake_amount)
+        shake_x = self.fx_rng.uniform(-self.shake_amount, self.shake_amount)
+        shake_y = self.fx_rng.uniform(-self.shake_amount, self.shake_amount)
         
-        # Draw glow first
-        glow_surf = pygame.Surface((self.glow_radius * 4, self.glow_radius * 4), pygame.SRCALPHA)
-        for i in range(3):
-            glow_radius = self.glow_radius * (3 - i) / 3
-            alpha = 60 - i * 20  # Reduced glow intensity
-            pygame.draw.circle(glow_surf, (*color, alpha), 
-                             (self.glow_radius * 2, self.glow_radius * 2), 
-                             glow_radius)
-        screen.blit(glow_surf, 
-                   (self.pos[0] - self.glow_radius * 2 + shake_x,
-                    self.pos[1] - self.glow_radius * 2 + shake_y))
-        
-        # Create surface for orb
-        orb_surface = pygame.Surface((self.radius * 4, self.radius * 4), pygame.SRCALPHA)
-        
-        # Light position in orb surface coordinates
-        light_pos = [self.radius * 2 + self.light_offset[0], 
-                    self.radius * 2 + self.light_offset[1]]
-        
-        if self.exploding:
-            # Explosion effect with lighting
-            explosion_radius = self.radius * (1 + self.explosion_progress * 2)
-            alpha = int(255 * (1 - self.explosion_progress))
-            self.draw_lit_sphere(orb_surface, color, (self.radius * 2, self.radius * 2), 
-                               explosion_radius, light_pos, alpha)
-        elif self.imploding:
-            # Implosion effect with lighting
-            current_radius = self.radius * (1 - self.implosion_progress * 0.5)
-            self.draw_lit_sphere(orb_surface, color, (self.radius * 2, self.radius * 2), 
-                               current_radius, light_pos)
+        # Draw glow first, its pulse is snapped to whole pixels so the sprites can be reused
+        if profiling:
+            profiler.begin('orb_glow')
+        glow_radius = int(round(self.glow_radius))
+        glow_surf = glow_cache.get(('orb', glow_radius, tuple(color)),
+                                   lambda: self.render_glow(glow_radius, color))
+        rect = screen.blit(glow_surf, 
+                           (self.pos[0] - glow_radius * 2 + shake_x,
+                            self.pos[1] - glow_radius * 2 + shake_y))
+        if profiling:
+            profiler.end('orb_glow')
+            profiler.begin('orb_sphere')
+        
+        if self.sprite_sheet and not (self.exploding or self.imploding):
+            # Normal orb is a single blit from the pre-shaded frames
+            frame_rect = self.sprite_sheet.get_frame(self.interpolated_rotation(alpha), self)
+            rect.union_ip(screen.blit(self.sprite_sheet.sheet, (self.pos[0] - self.radius + shake_x,
+                                                                self.pos[1] - self.radius + shake_y),
+                                      frame_rect))
+            self.sprite_sheet.fill(self, ORB_SHEET_FILL_BUDGET)
         else:
-            # Normal orb with lighting
-            self.draw_lit_sphere(orb_surface, color, (self.radius * 2, self.radius * 2), 
-                               self.radius, light_pos)
-        
-        # Draw the lit orb
-        screen.blit(orb_surface, (self.pos[0] - self.radius * 2 + shake_x,
-                                 self.pos[1] - self.radius * 2 + shake_y))
-        
-        # Draw particles with lighting
-        for particle in self.particles:
-            pos, _, lifetime = particle
-            alpha = int(255 * (lifetime / 30))
-            particle_color = (*color, alpha)
-            pygame.draw.circle(screen, particle_color, (int(pos[0]), int(pos[1])), 2)
+            # Create surface for orb
+            orb_surface = surface_pool.acquire((self.radius * 4, self.radius * 4))
+            
+            # Light position in orb surface coordinates
+            light_pos = [self.radius * 2 + self.light_offset[0], 
+                        self.radius * 2 + self.light_offset[1]]
+            rotation = self.interpolated_rotation(alpha)
+            
+            if self.exploding:
+                # Explosion effect with lighting
+                explosion_radius = self.radius * (1 + self.explosion_progress * 2)
+                opacity = int(255 * (1 - self.explosion_progress))
+                self.draw_lit_sphere(orb_surface, color, (self.radius * 2, self.radius * 2), 
+                                   explosion_radius, light_pos, opacity, rotation)
+            elif self.imploding:
+                # Implosion effect with lighting
+                current_radius = self.radius * (1 - self.implosion_progress * 0.5)
+                self.draw_lit_sphere(orb_surface, color, (self.radius * 2, self.radius * 2), 
+                                   current_radius, light_pos, rotation=rotation)
+            else:
+                # Normal orb with lighting
+                self.draw_lit_sphere(orb_surface, color, (self.radius * 2, self.radius * 2), 
+                                   self.radius, light_pos, rotation=rotation)
+            
+            # Draw the lit orb
+            rect.union_ip(screen.blit(orb_surface, (self.pos[0] - self.radius * 2 + shake_x,
+                                                   self.pos[1] - self.radius * 2 + shake_y)))
+        if profiling:
+            profiler.end('orb_sphere')
+            profiler.begin('occlusion')
+            
+        # Darken the parts of the orb the paddles keep out of the light
+        if self.occlusion.shadow and not (self.exploding or self.imploding):
+            rect.union_ip(screen.blit(self.occlusion.shadow, (self.pos[0] - self.radius + shake_x,
+                                                              self.pos[1] - self.radius + shake_y)))
+        if profiling:
+            profiler.end('occlusion')
+        return rect
 
 class Game:
-    def __init__(self):
-        # Set up display to handle different screen sizes
-        display_info = pygame.display.Info()
-        self.screen_width = display_info.current_w
-        self.screen_height = display_info.current_h
-        
-        target_ratio = WINDOW_SIZE[0] / WINDOW_SIZE[1]
-        screen_ratio = self.screen_width / self.screen_height
+    def __init__(self, headless=False, seed=None, clock=None, dirty_rects=DIRTY_RECTS, record=RECORD_REPLAY,
+                 scores=None):
+        """
+        headless: simulate without a display, fonts or textures (for soak tests and CI)
+        seed: seed for all game randomness, the same seed and inputs replay the same game
+        clock: time source for countdowns, defaults to simulated time when headless or recording
+        dirty_rects: clear and upload only the areas drawn this frame and last, instead of the whole screen
+                     (stars are only redrawn every STAR_LAYER_INTERVAL frames then)
+        record: keep a replay of this game in self.recorder
+        scores: HighScoreStore the final score goes to, defaults to the shared high_scores unless headless
+        """
+        self.headless = headless
+        self.dirty_rects = dirty_rects
+        self.record = record
+        if scores is None:
+            scores = HighScoreStore(None) if headless else high_scores
+        self.scores = scores
+        self.star_layer = None  # Background and stars in dirty rect mode, made on the first frame
         
-        # Swap width and height for portrait mode
-        if screen_ratio > target_ratio:
-            self.screen_width = min(self.screen_width, 640)  # iPhone-like width
-            self.screen_height = int(self.screen_width * (WINDOW_SIZE[1] / WINDOW_SIZE[0]))
+        if headless:
+            self.screen_width, self.screen_height = WINDOW_SIZE
+            self.screen = None
+            self.clock = None
         else:
-            self.screen_height = min(self.screen_height, 1280)
-            self.screen_width = int(self.screen_height * target_ratio)
-
-        # Explicitly set the screen dimensions for portrait mode
-        self.screen = pygame.display.set_mode((WINDOW_SIZE[0], WINDOW_SIZE[1]))
-        pygame.display.set_caption("Orbital Pong")
-        self.clock = pygame.time.Clock()
+            self.init_display()
+        
+        # Initialize fonts with Press Start 2P
+        self.font = None
+        self.big_font = None
+        self.score_glyphs = None
+        if not headless:
+            try:
+                self.font = pygame.font.Font("PressStart2P.ttf", 16)  # Smaller size for HUD as this font runs large
+                self.big_font = pygame.font.Font("PressStart2P.ttf", 32)  # Larger for countdown/game over
+            except:
+                print("Could not load Press Start 2P font, falling back to system font")
+                self.font = pygame.font.SysFont("Courier New", 28, bold=True)
+                self.big_font = pygame.font.SysFont("Courier New", 56, bold=True)
+            self.prerender_text()
+        
+        self.central_orb = None
+        self.reset(seed, clock)
+        
+    def reset(self, seed=None, clock=None):
+        """
+        Start a new game in place, keeping the window, fonts and orb texture
+        seed, clock: as for a new Game
+        """
+        self.drawn_rects = None  # Areas drawn last frame in dirty rect mode, None until a frame is drawn
+        self.drawn_background = None
+        self.star_layer_age = 0  # Frames since the stars were drawn onto star_layer
+        self.ticks = 0  # Simulation steps since the game started
+        self.seed = seed if seed is not None else random.randrange(2**32)
+        self.rng = random.Random(self.seed)
+        self.recorder = ReplayRecorder(self.seed) if self.record else None
+        # Stars, shake and particles get their own stream so effects never shift gameplay randomness
+        self.fx_rng = random.Random(self.seed ^ 0x5EED)
+        if clock is None:
+            # Countdowns must end on the same tick when a recording is played back
+            clock = VirtualClock() if self.headless or self.record else WallClock()
+        self.game_clock = clock
         
         # Initialize game state
-        self.ball = Ball()
-        self.ball.game = self  # Store the game instance in the ball
+        self.particles = ParticleSystem(enabled=not self.headless)  # Shared by every emitter in this game
+        self.ball = Ball(self.rng, self.particles, self.fx_rng)
         self.lives = INITIAL_LIVES
         self.level = 1
         self.score = 0
-        self.high_score = 0
+        self.high_score = self.scores.best
         self.game_over = False
         self.hits = 0
         self.hits_for_next_level = 10
+        self.paddle_hits = 0  # Ball/paddle hits over the whole game
         self.orb_color = BRIGHT_GREEN
         self.countdown_active = False
         self.countdown_time = 0
         self.level_transition = False
         self.show_life_added = False
         self.life_added_time = 0
-        
-        # Initialize fonts with Press Start 2P
-        try:
-            self.font = pygame.font.Font("PressStart2P.ttf", 16)  # Smaller size for HUD as this font runs large
-            self.big_font = pygame.font.Font("PressStart2P.ttf", 32)  # Larger for countdown/game over
-        except:
-            print("Could not load Press Start 2P font, falling back to system font")
-            self.font = pygame.font.SysFont("Courier New", 28, bold=True)
-            self.big_font = pygame.font.SysFont("Courier New", 56, bold=True)
+        self.touch_y = None  # Latest mouse/touch y, drags steer the paddles
+        self.last_touch_y = None
+        self.accumulator = 0.0  # Real time not yet covered by fixed simulation steps
+        self.previous_time = time.perf_counter()
         
         # Create exactly 4 snakes, one per border
         self.snakes = []
         # Create one snake for each border, positioned to take up middle 50%
         for i in range(4):
-            snake = Snake(i)  # 0=bottom, 1=right, 2=top, 3=left
+            snake = Snake(i, self.fx_rng, self.particles)  # 0=bottom, 1=right, 2=top, 3=left
             self.snakes.append(snake)
             
-        self.stars = [Star() for _ in range(NUM_STARS)]
-        self.central_orb = CentralOrb()
+        self.starfield = Starfield(NUM_STARS, self.fx_rng)
+        # The texture from the last game is reused, its sprite sheet is shared through orb_sprite_sheets
+        texture = self.central_orb.texture if self.central_orb is not None else None
+        self.central_orb = CentralOrb(load_texture=not self.headless, rng=self.rng,
+                                      fx_rng=self.fx_rng, clock=self.game_clock,
+                                      particles=self.particles, texture=texture)
+        
+    def init_display(self):
+        # Set up display to handle different screen sizes
+        display_info = pygame.display.Info()
+        self.screen_width = display_info.current_w
+        self.screen_height = display_info.current_h
+        
+        target_ratio = WINDOW_SIZE[0] / WINDOW_SIZE[1]
+        screen_ratio = self.screen_width / self.screen_height
+        
+        # Swap width and height for portrait mode
+        if screen_ratio > target_ratio:
+            self.screen_width = min(self.screen_width, 640)  # iPhone-like width
+            self.screen_height = int(self.screen_width * (WINDOW_SIZE[1] / WINDOW_SIZE[0]))
+        else:
+            self.screen_height = min(self.screen_height, 1280)
+            self.screen_width = int(self.screen_height * target_ratio)
+
+        # Explicitly set the screen dimensions for portrait mode, keeping a window
+        # the web entry point already opened with its own scaling flags
+        self.screen = pygame.display.get_surface()
+        if self.screen is None or self.screen.get_size() != WINDOW_SIZE:
+            self.screen = pygame.display.set_mode((WINDOW_SIZE[0], WINDOW_SIZE[1]))
+        pygame.display.set_caption("Orbital Pong")
+        self.clock = pygame.time.Clock()
+        
+    def now(self):
+        """Game time in seconds from the game clock"""
+        return self.game_clock.time()
         
     def draw_heart(self, screen, x, y, size=20, color=(255, 0, 0)):
         """
@@ -825,17 +2032,18 @@ class Game:
         :param y: y-coordinate of heart center
         :param size: size of the heart
         :param color: color of the heart
+        :return: rect covering the heart
         """
         # Adjust size and positioning
         radius = size // 2
         
         # Draw two filled circles for the top of the heart
-        pygame.draw.circle(screen, color, 
-                           (int(x - radius//2), int(y)), 
-                           radius//2)
-        pygame.draw.circle(screen, color, 
-                           (int(x + radius//2), int(y)), 
-                           radius//2)
+        rect = pygame.draw.circle(screen, color, 
+                                  (int(x - radius//2), int(y)), 
+                                  radius//2)
+        rect.union_ip(pygame.draw.circle(screen, color, 
+                                         (int(x + radius//2), int(y)), 
+                                         radius//2))
         
         # Draw filled triangle for bottom of heart
         points = [
@@ -843,7 +2051,7 @@ class Game:
             (x - radius, y),  # left point
             (x + radius, y)   # right point
         ]
-        pygame.draw.polygon(screen, color, points)
+        return rect.union(pygame.draw.polygon(screen, color, points))
 
     def update_orb_color(self):
         progress = self.hits / self.hits_for_next_level
@@ -884,6 +2092,7 @@ class Game:
             self.lives -= 1
             if self.lives <= 0:
                 self.game_over = True
+                self.scores.add(self.score, self.level)
             else:
                 # Change ball color to red and add red artifacts
                 self.ball.color = DARK_RED
@@ -892,7 +2101,7 @@ class Game:
                 # Activate countdown and reset ball
                 self.ball.reset()
                 self.countdown_active = True
-                self.countdown_time = time.time()
+                self.countdown_time = self.now()
 
     def start_level_transition(self):
         self.level_transition = True
@@ -901,9 +2110,20 @@ class Game:
         # Add a life when a level is completed
         self.lives += 1
         self.show_life_added = True
-        self.life_added_time = time.time()
+        self.life_added_time = self.now()
 
+    def prerender_text(self):
+        """Rasterize the fixed strings up front, so the frames that first show them don't stall"""
+        for text, color in (("+1 LIFE", BRIGHT_GREEN), ("GET READY!", WHITE),
+                            ("PRESS SPACE TO RESTART", WHITE)):
+            text_cache.render(self.font, text, color)
+        for text in ("GAME OVER", "1", "2", "3"):
+            text_cache.render(self.big_font, text, WHITE)
+        # The score changes all the time, so it is drawn digit by digit
+        self.score_glyphs = GlyphAtlas(self.font, "0123456789", (0, 150, 255))  # Blue color
+        
     def draw_hud(self):
+        """Draw level, score, lives and the extra life notice, returns the rect they covered"""
         # Create compact HUD elements
         margin = 10
         spacing = 15  # Reduced spacing between HUD elements
@@ -912,19 +2132,18 @@ class Game:
         level_text = f"LVL {self.level}"
         score_text = f"{self.score:05d}"
         
-        # Render text surfaces
-        level_surf = self.font.render(level_text, True, WHITE)
-        score_surf = self.font.render(score_text, True, (0, 150, 255))  # Blue color
+        # Level only changes between levels, so its surface comes from the cache
+        level_surf = text_cache.render(self.font, level_text, WHITE)
         
         # Calculate total width of HUD elements
         total_width = (self.lives * 25)  # Space for hearts 
         
         # Draw level at the left
-        self.screen.blit(level_surf, (margin, margin))
+        rect = self.screen.blit(level_surf, (margin, margin))
         
         # Draw score in blue, centered
-        score_x = (WINDOW_SIZE[0] - score_surf.get_width()) // 2
-        self.screen.blit(score_surf, (score_x, margin))
+        score_x = (WINDOW_SIZE[0] - self.score_glyphs.width(score_text)) // 2
+        rect.union_ip(self.score_glyphs.draw(self.screen, score_text, (score_x, margin)))
         
         # Draw hearts for lives aligned to the right
         heart_size = 15
@@ -932,153 +2151,376 @@ class Game:
         total_hearts_width = self.lives * heart_spacing
         heart_x = WINDOW_SIZE[0] - total_hearts_width - margin
         for i in range(self.lives):
-            self.draw_heart(self.screen, 
-                            heart_x + i * heart_spacing, 
-                            margin + level_surf.get_height() // 2, 
-                            size=heart_size)
+            rect.union_ip(self.draw_heart(self.screen, 
+                                          heart_x + i * heart_spacing, 
+                                          margin + level_surf.get_height() // 2, 
+                                          size=heart_size))
             
         # Show +1 life indicator
-        if self.show_life_added and time.time() - self.life_added_time < 2:
+        if self.show_life_added and self.now() - self.life_added_time < 2:
             life_added_text = "+1 LIFE"
-            life_added_surf = self.font.render(life_added_text, True, BRIGHT_GREEN)
+            life_added_surf = text_cache.render(self.font, life_added_text, BRIGHT_GREEN)
             life_added_x = (WINDOW_SIZE[0] - life_added_surf.get_width()) // 2
             life_added_y = margin + level_surf.get_height() + 10
-            self.screen.blit(life_added_surf, (life_added_x, life_added_y))
+            rect.union_ip(self.screen.blit(life_added_surf, (life_added_x, life_added_y)))
             
             # Reset flag after displaying
-            if time.time() - self.life_added_time >= 2:
+            if self.now() - self.life_added_time >= 2:
                 self.show_life_added = False
+        return rect
                 
     def draw_glitch_overlay(self):
         # Draw a glitchy overlay effect
-        overlay = pygame.Surface((self.screen_width, self.screen_height))
+        overlay = surface_pool.acquire((self.screen_width, self.screen_height), 0)
         overlay.set_alpha(50)  # Semi-transparent
         overlay.fill(DARK_RED)  # Red tint
         self.screen.blit(overlay, (0, 0))
 
-    def run(self):
-        while True:
-            for event in pygame.event.get():
-                if event.type == pygame.QUIT:
-                    pygame.quit()
-                    sys.exit()
-                elif event.type == pygame.KEYDOWN and self.game_over:
-                    if event.key == pygame.K_SPACE:
-                        self.__init__()
-
-            if not self.game_over:
-                # Update stars
-                for star in self.stars:
-                    star.move()
-                    
-                # Update central orb
-                self.central_orb.update()
-                
-                # Handle input
-                keys = pygame.key.get_pressed()
-                move = 0
-                if keys[pygame.K_LEFT] or keys[pygame.K_a]:
-                    move = -PADDLE_SPEED
-                elif keys[pygame.K_RIGHT] or keys[pygame.K_d]:
-                    move = PADDLE_SPEED
+    def update(self, move):
+        """Advance the simulation by one SIM_DT tick with the given paddle move amount"""
+        # Effects keep playing out behind the game over screen, headless runs have none to play
+        if not self.headless:
+            self.particles.update()
+            for snake in self.snakes:
+                snake.update_effects()
+            
+        if self.game_over:
+            return
+        self.ticks += 1
+        self.game_clock.advance(SIM_DT)
+        self.ball.prev_pos = list(self.ball.pos)
+        self.ball.reset_collision_counts()
+        
+        profiling = profiler.enabled
+        
+        # Update stars, they are only scenery so headless runs skip them
+        if not self.headless:
+            if profiling:
+                profiler.begin('star_update')
+            self.starfield.update()
+            if profiling:
+                profiler.end('star_update')
+            
+        # Update central orb
+        if profiling:
+            profiler.begin('orb_update')
+        self.central_orb.update()
+        if profiling:
+            profiler.end('orb_update')
+        
+        # Move snakes
+        if profiling:
+            profiler.begin('snake_move')
+        for snake in self.snakes:
+            snake.move(move)
+        if profiling:
+            profiler.end('snake_move')
 
-                # Move snakes
-                for snake in self.snakes:
-                    snake.move(move)
+        # Handle countdown after life loss
+        if self.countdown_active:
+            elapsed = self.now() - self.countdown_time
+            if elapsed >= 3:  # 3 second countdown
+                self.countdown_active = False
+                self.ball.color = WHITE
+        else:
+            # Update ball
+            if not self.level_transition:
+                if profiling:
+                    profiler.begin('ball_move')
+                orb_hit = self.ball.move()
+                if profiling:
+                    profiler.end('ball_move')
+                if orb_hit:
+                    self.hits += 1
+                    self.update_orb_color()
+                    self.central_orb.hit(self.orb_color)
+                    # Add score for hitting the orb
+                    self.update_score(100 * self.level)  # More points in higher levels
+                    if self.hits >= self.hits_for_next_level:
+                        self.start_level_transition()
+        
+        # Handle level transition
+        if self.level_transition and not self.central_orb.trapped_ball:
+            self.level += 1
+            self.hits = 0
+            self.orb_color = BRIGHT_GREEN
+            self.ball.reset()
+            self.countdown_active = True
+            self.countdown_time = self.now()
+            self.level_transition = False
+        else:
+            # Check for snake collisions
+            if profiling:
+                profiler.begin('collision')
+            if self.ball.hit_snakes(self.snakes):
+                self.paddle_hits += 1
+                # Add score for paddle hits
+                self.update_score(10 * self.level)  # Small bonus for paddle hits
 
-                # Handle countdown after life loss
-                if self.countdown_active:
-                    elapsed = time.time() - self.countdown_time
-                    if elapsed >= 3:  # 3 second countdown
-                        self.countdown_active = False
-                        self.ball.color = WHITE
-                else:
-                    # Update ball
-                    if not self.level_transition:
-                        orb_hit = self.ball.move()
-                        if orb_hit:
-                            self.central_orb.hit()
-                            self.hits += 1
-                            self.update_orb_color()
-                            # Add score for hitting the orb
-                            self.update_score(100 * self.level)  # More points in higher levels
-                            if self.hits >= self.hits_for_next_level:
-                                self.start_level_transition()
+            self.check_ball_out()
+            if profiling:
+                profiler.end('collision')
                 
-                # Handle level transition
-                if self.level_transition and not self.central_orb.trapped_ball:
-                    self.level += 1
-                    self.hits = 0
-                    self.orb_color = BRIGHT_GREEN
-                    self.ball.reset()
-                    self.countdown_active = True
-                    self.countdown_time = time.time()
-                    self.level_transition = False
-                else:
-                    # Check for snake collisions
-                    for snake in self.snakes:
-                        if self.ball.hit_snake(snake.segments):
-                            # Add score for paddle hits
-                            self.update_score(10 * self.level)  # Small bonus for paddle hits
-                            break
-
-                    self.check_ball_out()
+        if self.recorder is not None:
+            self.recorder.record(move, self)
+            
+    def checksum(self):
+        """CRC32 of the gameplay state, a replay that drifts from its recording stops matching"""
+        state = [self.ticks, self.lives, self.level, self.score, self.hits,
+                 *self.ball.pos, *self.ball.vel, self.ball.speed]
+        for snake in self.snakes:
+            state += (snake.side, snake.progress, snake.velocity)
+        return zlib.crc32(struct.pack('<%dd' % len(state), *state))
 
-            # Draw
-            if self.central_orb.next_background and self.central_orb.exploding:
-                # Transition background during explosion
-                progress = self.central_orb.explosion_progress
-                current_color = [
-                    int(self.central_orb.background_color[i] * (1 - progress) + 
-                        self.central_orb.next_background[i] * progress)
-                    for i in range(3)
-                ]
-                self.screen.fill(current_color)
-            else:
-                self.screen.fill(self.central_orb.background_color)
+    def draw(self, alpha=1.0):
+        """
+        Render the current state
+        alpha: how far between the last two simulation steps to draw moving objects (0-1)
+        Returns the rects to pass to pygame.display.update in dirty rect mode, None when the whole screen changed
+        """
+        if self.game_over:
+            alpha = 1.0  # Nothing moves any more, so draw the final positions
+        profiling = profiler.enabled
+        dirty = self.dirty_rects
             
-            # Draw stars
-            for star in self.stars:
-                pygame.draw.circle(self.screen, WHITE,
-                                 (int(star.x), int(star.y)),
-                                 star.size)
+        if self.central_orb.next_background and self.central_orb.exploding:
+            # Transition background during explosion
+            progress = self.central_orb.explosion_progress
+            background = tuple(
+                int(self.central_orb.background_color[i] * (1 - progress) + 
+                    self.central_orb.next_background[i] * progress)
+                for i in range(3)
+            )
+        else:
+            background = tuple(self.central_orb.background_color)
             
-            # Draw central orb with effects and snake shadows
-            self.central_orb.draw(self.screen, self.orb_color, self.snakes)
+        # The countdown tints the whole screen, and a new background color changes every pixel
+        full_frame = (not dirty or self.countdown_active or self.drawn_rects is None
+                      or background != self.drawn_background)
+        rects = []  # Areas drawn this frame
+        
+        # Draw stars
+        if profiling:
+            profiler.begin('star_draw')
+        if not dirty:
+            self.screen.fill(background)
+            self.starfield.draw(self.screen)
+        else:
+            # Stars move all over the screen every frame, so they are kept on a layer that is
+            # only redrawn every few frames and the frames between only update what moved
+            self.star_layer_age += 1
+            if full_frame or self.star_layer_age >= STAR_LAYER_INTERVAL:
+                if self.star_layer is None:
+                    self.star_layer = self.screen.copy()
+                self.star_layer.fill(background)
+                self.starfield.draw(self.star_layer)
+                self.star_layer_age = 0
+                full_frame = True
+            if full_frame:
+                self.screen.blit(self.star_layer, (0, 0))
+            else:
+                # Everything drawn last frame is within these, restoring them leaves just the stars
+                screen_rect = self.screen.get_rect()
+                for rect in self.drawn_rects:
+                    area = rect.clip(screen_rect)
+                    self.screen.blit(self.star_layer, area, area)
+        if profiling:
+            profiler.end('star_draw')
+        
+        # Draw central orb with effects and snake shadows
+        rects.append(self.central_orb.draw(self.screen, self.orb_color, self.snakes, alpha))
 
-            # Draw snakes
-            for snake in self.snakes:
-                snake.draw(self.screen, WHITE)
+        # Draw snakes
+        if profiling:
+            profiler.begin('snake_draw')
+        for snake in self.snakes:
+            rects.append(snake.draw(self.screen, WHITE, alpha))
+        if profiling:
+            profiler.end('snake_draw')
+
+        # Draw ball with trail
+        if profiling:
+            profiler.begin('ball_draw')
+        rects.append(self.ball.draw(self.screen, alpha))
+        if profiling:
+            profiler.end('ball_draw')
+        
+        # Draw sparks, artifacts and orb debris in one batch
+        if profiling:
+            profiler.begin('particle_draw')
+        particle_rects = self.particles.draw(self.screen, dirty)
+        if dirty:
+            rects.extend(particle_rects)
+        if profiling:
+            profiler.end('particle_draw')
+        
+        # Draw HUD
+        if profiling:
+            profiler.begin('hud')
+        rects.append(self.draw_hud())
+        
+        # Draw countdown or game over
+        if self.countdown_active:
+            self.draw_glitch_overlay()
+            countdown = 3 - int(self.now() - self.countdown_time)
+            if countdown > 0:
+                countdown_text = text_cache.render(self.big_font, str(countdown), WHITE)
+                text_rect = countdown_text.get_rect(center=(WINDOW_SIZE[0]/2, WINDOW_SIZE[1]/2))
+                self.screen.blit(countdown_text, text_rect)
+                ready_text = text_cache.render(self.font, "GET READY!", WHITE)
+                ready_rect = ready_text.get_rect(center=(WINDOW_SIZE[0]/2, WINDOW_SIZE[1]/2 + 50))
+                self.screen.blit(ready_text, ready_rect)
 
-            # Draw ball with trail
-            self.ball.draw(self.screen)
+        if self.game_over:
+            game_over_text = text_cache.render(self.big_font, "GAME OVER", WHITE)
+            text_rect = game_over_text.get_rect(center=(WINDOW_SIZE[0]/2, WINDOW_SIZE[1]/2))
+            rects.append(self.screen.blit(game_over_text, text_rect))
             
-            # Draw HUD
-            self.draw_hud()
+            restart_text = text_cache.render(self.font, "PRESS SPACE TO RESTART", WHITE)
+            restart_rect = restart_text.get_rect(center=(WINDOW_SIZE[0]/2, WINDOW_SIZE[1]/2 + 50))
+            rects.append(self.screen.blit(restart_text, restart_rect))
             
-            # Draw countdown or game over
-            if self.countdown_active:
-                self.draw_glitch_overlay()
-                countdown = 3 - int(time.time() - self.countdown_time)
-                if countdown > 0:
-                    countdown_text = self.big_font.render(str(countdown), True, WHITE)
-                    text_rect = countdown_text.get_rect(center=(WINDOW_SIZE[0]/2, WINDOW_SIZE[1]/2))
-                    self.screen.blit(countdown_text, text_rect)
-                    ready_text = self.font.render("GET READY!", True, WHITE)
-                    ready_rect = ready_text.get_rect(center=(WINDOW_SIZE[0]/2, WINDOW_SIZE[1]/2 + 50))
-                    self.screen.blit(ready_text, ready_rect)
+            best_text = text_cache.render(self.font, "BEST %d" % self.high_score, (0, 150, 255))
+            best_rect = best_text.get_rect(center=(WINDOW_SIZE[0]/2, WINDOW_SIZE[1]/2 + 80))
+            rects.append(self.screen.blit(best_text, best_rect))
+            
+        if profiling:
+            profiler.end('hud')
+            rects.append(profiler.draw(self.screen))
+            
+        if not dirty:
+            return None
+        previous_rects = self.drawn_rects
+        # The countdown overlay tinted the whole screen, so the frame after it has to redraw all of it
+        self.drawn_rects = None if self.countdown_active else rects
+        self.drawn_background = background
+        if full_frame:
+            return None
+        # Last frame's areas were cleared, this frame's were drawn
+        return previous_rects + rects
 
-            if self.game_over:
-                game_over_text = self.big_font.render('GAME OVER', True, WHITE)
-                text_rect = game_over_text.get_rect(center=(WINDOW_SIZE[0]/2, WINDOW_SIZE[1]/2))
-                self.screen.blit(game_over_text, text_rect)
-                
-                restart_text = self.font.render('PRESS SPACE TO RESTART', True, WHITE)
-                restart_rect = restart_text.get_rect(center=(WINDOW_SIZE[0]/2, WINDOW_SIZE[1]/2 + 50))
-                self.screen.blit(restart_text, restart_text)
-                
+    def handle_event(self, event):
+        """React to one pygame event, returns False when the player closes the game"""
+        if event.type == pygame.QUIT:
+            return False
+        elif event.type == pygame.KEYDOWN and event.key == pygame.K_F3:
+            if profiler.enabled:
+                profiler.disable()
+            else:
+                profiler.enable()
+        elif event.type == pygame.KEYDOWN and event.key == pygame.K_F4:
+            # On the web build these land in the browser's virtual filesystem
+            profiler.dump_csv('profile.csv')
+            profiler.dump_json('profile.json')
+        elif event.type == pygame.KEYDOWN and event.key == pygame.K_F5:
+            if self.recorder is not None:
+                self.recorder.save('replay.bin')
+        elif event.type == pygame.KEYDOWN and self.game_over:
+            if event.key == pygame.K_SPACE:
+                self.reset()
+        elif event.type == pygame.MOUSEMOTION:
+            self.touch_y = event.pos[1]
+        elif event.type == pygame.FINGERMOTION:
+            # Touch positions are normalized to the window, whole pixels like the mouse keep replays small
+            self.touch_y = round(event.y * WINDOW_SIZE[1])
+        return True
+        
+    def read_input(self):
+        """Paddle move amount for this frame from the keyboard, or from dragging"""
+        keys = pygame.key.get_pressed()
+        move = 0
+        if keys[pygame.K_LEFT] or keys[pygame.K_a]:
+            move = -PADDLE_SPEED
+        elif keys[pygame.K_RIGHT] or keys[pygame.K_d]:
+            move = PADDLE_SPEED
+        elif self.touch_y is not None and self.last_touch_y is not None:
+            # Dragging down moves the paddles like holding right
+            move = max(-PADDLE_SPEED, min(PADDLE_SPEED, self.touch_y - self.last_touch_y))
+        self.last_touch_y = self.touch_y
+        return move
+        
+    def step(self):
+        """Handle input, simulate the elapsed time and render one frame, returns False once the player quits"""
+        surface_pool.begin_frame()
+        if profiler.enabled:
+            profiler.begin('frame')
+        
+        for event in pygame.event.get():
+            if not self.handle_event(event):
+                return False
+        move = self.read_input()
+            
+        # Run as many fixed steps as real time has covered, so slow frames don't slow the game
+        current_time = time.perf_counter()
+        self.accumulator += current_time - self.previous_time
+        self.previous_time = current_time
+        steps = 0
+        while self.accumulator >= SIM_DT and steps < MAX_SIM_STEPS:
+            self.update(move)
+            self.accumulator -= SIM_DT
+            steps += 1
+        if steps == MAX_SIM_STEPS:
+            # Too far behind to catch up, drop the backlog rather than spiral
+            self.accumulator = min(self.accumulator, SIM_DT)
+
+        rects = self.draw(self.accumulator / SIM_DT)
+        if profiler.enabled:
+            profiler.begin('flip')
+        self.present(rects)
+        if profiler.enabled:
+            profiler.end('flip')
+            profiler.end('frame')
+            profiler.end_frame(pool_allocs=surface_pool.allocations,
+                               snake_tests=self.ball.snake_tests,
+                               segment_tests=self.ball.segment_tests,
+                               particles=self.particles.count)
+        return True
+        
+    def present(self, rects):
+        """Show the frame, uploading only rects when draw returned them"""
+        if rects is None:
             pygame.display.flip()
+        else:
+            pygame.display.update(rects)
+        
+    async def tick(self):
+        """Run one frame, then yield to the event loop for the rest of the frame budget"""
+        frame_start = time.perf_counter()
+        running = self.step()
+        await asyncio.sleep(max(0, frame_start + 1 / FPS - time.perf_counter()))
+        return running
+
+    def run(self):
+        while self.step():
             self.clock.tick(FPS)
+        self.scores.flush()
+        pygame.quit()
+        sys.exit()
+
+def play_replay(replay, headless=True):
+    """
+    Replay a recorded game from its seed and moves, returns (game, desync_tick)
+    headless: simulate as fast as possible, otherwise draw every tick at normal speed
+    desync_tick is the first checksummed tick that differs from the recording, None if all matched
+    """
+    game = Game(headless=headless, seed=replay.seed, clock=VirtualClock(), scores=HighScoreStore(None))
+    desync_tick = None
+    for move in replay.moves():
+        if not headless:
+            surface_pool.begin_frame()
+            if any(event.type == pygame.QUIT for event in pygame.event.get()):
+                break
+        game.update(move)
+        if game.ticks % replay.checksum_interval == 0 and desync_tick is None:
+            expected = replay.checksums[game.ticks // replay.checksum_interval - 1]
+            if game.checksum() != expected:
+                desync_tick = game.ticks
+                if event_log.enabled:
+                    event_log.emit('replay_desync', tick=game.ticks)
+        if not headless:
+            game.present(game.draw())
+            game.clock.tick(FPS)
+    return game, desync_tick
 
 # Create global game instance
 game = None
@@ -0,0 +1,467 @@
+"""
+Environments for training autoplayers against Orbital Pong
+
+VectorEnv simulates many independent games at once as NumPy arrays, following the
+same rules as Game.update: Snake.move, Ball.move, the swept ball/paddle collision
+behind Ball.hit_snakes, Game.check_ball_out and the level transition. Visual-only
+state (particles, stars, glows, the orb explosion) is not simulated.
+
+PongEnv runs one real Game behind a reset()/step(action) interface, and run_rollouts
+plays episodes of it over a process pool into a shared memory RolloutBuffer.
+"""
+import math
+import multiprocessing
+import signal
+from multiprocessing.shared_memory import SharedMemory
+
+import numpy
+import pygame
+
+from orbital_pong import (WINDOW_SIZE, BALL_RADIUS, PADDLE_THICKNESS, PADDLE_SPEED,
+                          INITIAL_BALL_SPEED, INITIAL_REPEL_SPEED, INITIAL_LIVES,
+                          CENTRAL_ORB_RADIUS, SIM_DT, border_path, Game, VirtualClock,
+                          HighScoreStore, surface_pool)
+
+HITS_FOR_NEXT_LEVEL = 10  # Orb hits per level, as in Game
+COUNTDOWN_SECONDS = 3  # Ball stays put this long after a lost life or a new level
+SNAKE_POINTS = 20  # Points per snake, as in Snake.build_segments
+SNAKE_LENGTH = 0.5  # Sides covered by each snake, as in Snake
+OBS_SIZE = 8  # Values per observation, see observation()
+
+def observation(ball_pos, ball_vel, snake_side, snake_progress, snake_velocity, moving_inward, waiting):
+    """
+    One row of OBS_SIZE values per game, scaled to about -1..1: ball x and y, ball velocity x and y,
+    snake position around the border, snake velocity, ball heading inward, ball held by a countdown
+    or level transition. Every argument has one entry (row for positions) per game
+    """
+    obs = numpy.empty((len(ball_pos), OBS_SIZE), dtype=numpy.float32)
+    obs[:, 0] = ball_pos[:, 0] / WINDOW_SIZE[0]
+    obs[:, 1] = ball_pos[:, 1] / WINDOW_SIZE[1]
+    obs[:, 2:4] = ball_vel / INITIAL_REPEL_SPEED
+    obs[:, 4] = (snake_side + snake_progress) / 4
+    obs[:, 5] = snake_velocity / PADDLE_SPEED
+    obs[:, 6] = moving_inward
+    obs[:, 7] = waiting
+    return obs
+
+class VectorEnv:
+    """
+    num_envs independent games stepped in lockstep, one paddle move per game per step
+    All four snakes of a game get the same moves from the same start, so they share one
+    progress and velocity and snake k sits on side (snake_side + k) % 4
+    """
+    def __init__(self, num_envs, seed=None):
+        self.num_envs = num_envs
+        self.rng = numpy.random.default_rng(seed)
+        self.center = numpy.array([WINDOW_SIZE[0] // 2, WINDOW_SIZE[1] // 2], dtype=float)
+        self.path = numpy.array(border_path.points)  # Border path index -> (x, y)
+        self.last_scores = numpy.zeros(num_envs, dtype=numpy.int64)  # Score of each game's last finished episode
+        self.reset()
+
+    def reset(self, mask=None):
+        """Start new games for the envs selected by the boolean mask (all by default), returns observations"""
+        if mask is None:
+            mask = numpy.ones(self.num_envs, dtype=bool)
+            n = self.num_envs
+            self.ball_pos = numpy.zeros((n, 2))
+            self.ball_vel = numpy.zeros((n, 2))
+            self.moving_inward = numpy.zeros(n, dtype=bool)
+            self.snake_side = numpy.zeros(n, dtype=numpy.int64)
+            self.snake_progress = numpy.zeros(n)
+            self.snake_velocity = numpy.zeros(n)
+            self.hits = numpy.zeros(n, dtype=numpy.int64)
+            self.lives = numpy.zeros(n, dtype=numpy.int64)
+            self.level = numpy.zeros(n, dtype=numpy.int64)
+            self.score = numpy.zeros(n, dtype=numpy.int64)
+            self.ticks = numpy.zeros(n, dtype=numpy.int64)
+            self.time = numpy.zeros(n)  # Game clock, advanced by SIM_DT per tick
+            self.countdown_active = numpy.zeros(n, dtype=bool)
+            self.countdown_time = numpy.zeros(n)
+            self.level_transition = numpy.zeros(n, dtype=bool)
+            self.trapped = numpy.zeros(n, dtype=bool)  # Ball orbiting inside the orb before a new level
+            self.shake_phase = numpy.zeros(n)
+        self.snake_side[mask] = 0
+        self.snake_progress[mask] = 0.25
+        self.snake_velocity[mask] = 0
+        self.hits[mask] = 0
+        self.lives[mask] = INITIAL_LIVES
+        self.level[mask] = 1
+        self.score[mask] = 0
+        self.ticks[mask] = 0
+        self.time[mask] = 0
+        self.countdown_active[mask] = False
+        self.countdown_time[mask] = 0
+        self.level_transition[mask] = False
+        self.trapped[mask] = False
+        self.shake_phase[mask] = 0
+        self.reset_balls(mask)
+        return self.observe()
+
+    def reset_balls(self, mask):
+        """Ball.reset for the selected envs: a random border point, aimed at the center"""
+        n = int(numpy.count_nonzero(mask))
+        if n == 0:
+            return
+        side = self.rng.integers(0, 4, n)
+        x = self.rng.integers(0, WINDOW_SIZE[0], n, endpoint=True).astype(float)
+        y = self.rng.integers(0, WINDOW_SIZE[1], n, endpoint=True).astype(float)
+        x = numpy.select([side == 1, side == 3], [WINDOW_SIZE[0], 0], x)
+        y = numpy.select([side == 0, side == 2], [WINDOW_SIZE[1], 0], y)
+        pos = numpy.stack((x, y), axis=1)
+        self.ball_pos[mask] = pos
+        self.ball_vel[mask] = self.aim_at_center(pos)
+        self.moving_inward[mask] = True
+
+    def aim_at_center(self, pos):
+        """Velocities of INITIAL_BALL_SPEED from each position toward the center"""
+        delta = self.center - pos
+        dist = numpy.sqrt(delta[:, 0]*delta[:, 0] + delta[:, 1]*delta[:, 1])
+        return INITIAL_BALL_SPEED * (delta / dist[:, None])
+
+    def snake_segments(self, envs):
+        """
+        Segment end points of every snake in the given envs, shape (len(envs), 4 * SNAKE_POINTS, 2, 2)
+        Follows BorderPath.slice with a fixed point count: when no corner point is needed the
+        first point is repeated, and the zero length segment it makes never collides
+        """
+        steps = border_path.steps_per_side
+        total = border_path.total_steps
+        stride = round(SNAKE_LENGTH * steps / (SNAKE_POINTS - 1))
+        sides = (self.snake_side[envs, None] + numpy.arange(4)) % 4
+        start = (sides * steps + numpy.round(self.snake_progress[envs, None] * steps).astype(numpy.int64)) % total
+        end_offset = stride * (SNAKE_POINTS - 1)
+        corner = (start // steps + 1) * steps - start
+        needs_corner = (corner < end_offset) & (corner % stride != 0)
+        offsets = numpy.concatenate((numpy.broadcast_to(numpy.arange(SNAKE_POINTS) * stride, start.shape + (SNAKE_POINTS,)),
+                                     numpy.where(needs_corner, corner, 0)[..., None]), axis=-1)
+        offsets.sort(axis=-1)
+        points = self.path[(start[..., None] + offsets) % total]  # (envs, 4, SNAKE_POINTS + 1, 2)
+        segments = numpy.stack((points[:, :, :-1], points[:, :, 1:]), axis=3)
+        return segments.reshape(len(envs), -1, 2, 2)
+
+    def sweep(self, from_pos, move, start, end):
+        """
+        Ball.sweep_segment for many (ball, segment) pairs at once, earliest fraction of move per pair (inf for none)
+        All arguments are (n, 2) arrays, row i is one ball move against one segment
+        """
+        reach = BALL_RADIUS + PADDLE_THICKNESS/2
+        seg_d = end - start
+        seg_len = numpy.sqrt(seg_d[:, 0]*seg_d[:, 0] + seg_d[:, 1]*seg_d[:, 1])
+        mx, my = move[:, 0], move[:, 1]
+        with numpy.errstate(divide='ignore', invalid='ignore'):
+            ux, uy = seg_d[:, 0] / seg_len, seg_d[:, 1] / seg_len
+            rel = from_pos - start
+            along = rel[:, 0]*ux + rel[:, 1]*uy
+            across = rel[:, 0]*-uy + rel[:, 1]*ux
+            move_along = mx*ux + my*uy
+            move_across = mx*-uy + my*ux
+
+            # Entering through one of the two flat sides of the capsule
+            side = numpy.where(across > 0, reach, -reach)
+            t_flat = (side - across) / move_across
+            flat = ((move_across != 0) & (numpy.abs(across) > reach) & (t_flat >= 0) & (t_flat <= 1) &
+                    (along + move_along*t_flat >= 0) & (along + move_along*t_flat <= seg_len))
+            best = numpy.where(flat, t_flat, numpy.inf)
+
+            # Entering through one of the rounded ends
+            a = mx*mx + my*my
+            for cap in (start, end):
+                f = from_pos - cap
+                c = f[:, 0]*f[:, 0] + f[:, 1]*f[:, 1] - reach*reach
+                b = 2 * (mx*f[:, 0] + my*f[:, 1])
+                disc = b*b - 4*a*c
+                t = (-b - numpy.sqrt(disc)) / (2*a)
+                t = numpy.where((a == 0) | (disc < 0) | (b >= 0) | (t > 1), numpy.inf, t)
+                t = numpy.where(c <= 0, 0.0, t)  # Already touching
+                best = numpy.minimum(best, t)
+
+        # Already touching the body
+        best = numpy.where((numpy.abs(across) <= reach) & (along >= 0) & (along <= seg_len), 0.0, best)
+        return numpy.where(seg_len > 0, best, numpy.inf)
+
+    def step(self, moves):
+        """
+        Advance every game one tick with its paddle move amount (clipped to +-PADDLE_SPEED)
+        Returns (observations, rewards, dones): +1 per paddle hit and -1 per lost life, and
+        finished games are restarted, so their observation is the first of the next episode
+        """
+        moves = numpy.clip(numpy.asarray(moves, dtype=float), -PADDLE_SPEED, PADDLE_SPEED)
+        self.ticks += 1
+        self.time += SIM_DT
+        prev_pos = self.ball_pos.copy()
+        rewards = numpy.zeros(self.num_envs, dtype=numpy.float32)
+
+        # CentralOrb.update: orbit a trapped ball, then let it go after two turns
+        trapped = self.trapped
+        if trapped.any():
+            self.shake_phase[trapped] += 0.2
+            phase = self.shake_phase[trapped]
+            orbit_radius = CENTRAL_ORB_RADIUS * 0.8
+            self.ball_pos[trapped, 0] = self.center[0] + numpy.cos(phase) * orbit_radius
+            self.ball_pos[trapped, 1] = self.center[1] + numpy.sin(phase) * orbit_radius
+            self.trapped[trapped] = phase < math.pi * 4
+
+        # Snake.move: a move sets the velocity, no move brakes it
+        velocity = self.snake_velocity
+        braking = moves == 0
+        velocity[~braking] = moves[~braking]
+        velocity[braking] = numpy.where(velocity[braking] > 0, numpy.maximum(velocity[braking] - 0.5, 0),
+                                        numpy.minimum(velocity[braking] + 0.5, 0))
+        moving = velocity != 0
+        self.snake_progress[moving] += velocity[moving] / 100.0
+        over = self.snake_progress >= 1
+        under = self.snake_progress < 0
+        self.snake_progress[over] -= 1
+        self.snake_side[over] = (self.snake_side[over] + 1) % 4
+        self.snake_progress[under] += 1
+        self.snake_side[under] = (self.snake_side[under] - 1) % 4
+
+        # Countdown after a lost life or a new level
+        counting = self.countdown_active.copy()
+        self.countdown_active[counting & (self.time - self.countdown_time >= COUNTDOWN_SECONDS)] = False
+
+        # Ball.move: reaching the orb's center throws the ball back out and counts a hit
+        active = ~counting & ~self.level_transition
+        delta = self.ball_pos - self.center
+        dist = numpy.sqrt(delta[:, 0]*delta[:, 0] + delta[:, 1]*delta[:, 1])
+        orb_hit = active & self.moving_inward & (dist <= BALL_RADIUS)
+        flying = active & ~orb_hit
+        self.ball_pos[flying] += self.ball_vel[flying]
+        n = int(numpy.count_nonzero(orb_hit))
+        if n:
+            angle = self.rng.uniform(0, 2 * math.pi, n)
+            self.ball_vel[orb_hit] = numpy.stack((INITIAL_REPEL_SPEED * numpy.cos(angle),
+                                                  INITIAL_REPEL_SPEED * numpy.sin(angle)), axis=1)
+            self.moving_inward[orb_hit] = False
+            self.hits[orb_hit] += 1
+            self.score[orb_hit] += 100 * self.level[orb_hit]
+            # Game.start_level_transition
+            next_level = orb_hit & (self.hits >= HITS_FOR_NEXT_LEVEL)
+            self.level_transition[next_level] = True
+            self.trapped[next_level] = True
+            self.shake_phase[next_level] = 0
+            self.lives[next_level] += 1
+
+        # The orb let the ball go, start the next level
+        leveled = self.level_transition & ~self.trapped
+        if leveled.any():
+            self.level[leveled] += 1
+            self.hits[leveled] = 0
+            self.reset_balls(leveled)
+            self.countdown_active[leveled] = True
+            self.countdown_time[leveled] = self.time[leveled]
+            self.level_transition[leveled] = False
+
+        # Ball.hit_snakes, only for outward balls whose move comes within reach of the border the snakes are on
+        checked = ~leveled
+        reach = BALL_RADIUS + PADDLE_THICKNESS/2
+        near = numpy.zeros(self.num_envs, dtype=bool)
+        for pos in (prev_pos, self.ball_pos):
+            near |= ((pos[:, 0] <= reach) | (pos[:, 0] >= WINDOW_SIZE[0] - reach) |
+                     (pos[:, 1] <= reach) | (pos[:, 1] >= WINDOW_SIZE[1] - reach))
+        envs = numpy.nonzero(checked & near & ~self.moving_inward)[0]
+        if len(envs):
+            from_pos = prev_pos[envs]
+            move = self.ball_pos[envs] - from_pos
+            segments = self.snake_segments(envs)
+
+            # Skip segments whose box the move can't reach, like Ball.sweep_snake
+            low = numpy.minimum(from_pos, from_pos + move) - reach
+            high = numpy.maximum(from_pos, from_pos + move) + reach
+            seg_low = numpy.minimum(segments[:, :, 0], segments[:, :, 1])
+            seg_high = numpy.maximum(segments[:, :, 0], segments[:, :, 1])
+            rows, cols = numpy.nonzero(((high[:, None] >= seg_low) & (low[:, None] <= seg_high)).all(axis=2))
+            pair_t = self.sweep(from_pos[rows], move[rows], segments[rows, cols, 0], segments[rows, cols, 1])
+            t = numpy.full(len(envs), numpy.inf)
+            numpy.minimum.at(t, rows, pair_t)
+            hit = numpy.isfinite(t)
+            envs, t = envs[hit], t[hit]
+            impact = from_pos[hit] + move[hit] * t[:, None]
+            # Ball.bounce can't aim from the exact center, the ball then carries on
+            delta = self.center - impact
+            bounced = (delta[:, 0]*delta[:, 0] + delta[:, 1]*delta[:, 1]) > 0
+            envs, impact = envs[bounced], impact[bounced]
+            self.ball_pos[envs] = impact
+            self.ball_vel[envs] = self.aim_at_center(impact)
+            self.moving_inward[envs] = True
+            self.score[envs] += 10 * self.level[envs]
+            rewards[envs] += 1
+
+        # Game.check_ball_out
+        x, y = self.ball_pos[:, 0], self.ball_pos[:, 1]
+        out = checked & ((x < -BALL_RADIUS) | (x > WINDOW_SIZE[0] + BALL_RADIUS) |
+                         (y < -BALL_RADIUS) | (y > WINDOW_SIZE[1] + BALL_RADIUS))
+        self.lives[out] -= 1
+        rewards[out] -= 1
+        dones = out & (self.lives <= 0)
+        lost = out & ~dones
+        self.reset_balls(lost)
+        self.countdown_active[lost] = True
+        self.countdown_time[lost] = self.time[lost]
+
+        if dones.any():
+            self.last_scores[dones] = self.score[dones]
+            self.reset(dones)
+        return self.observe(), rewards, dones
+
+    def observe(self):
+        """Observations of every game, see observation()"""
+        return observation(self.ball_pos, self.ball_vel, self.snake_side, self.snake_progress,
+                           self.snake_velocity, self.moving_inward,
+                           self.countdown_active | self.level_transition)
+
+def observation_spec(render_size=None):
+    """(shape, dtype) of PongEnv observations, state vectors or frames of render_size"""
+    if render_size is None:
+        return (OBS_SIZE,), numpy.float32
+    return (render_size[1], render_size[0], 3), numpy.uint8
+
+class PongEnv:
+    """
+    One Game behind a reset()/step(action) interface, observed as in VectorEnv
+    render_size: (width, height) to observe downscaled frames from Game.draw instead,
+    as uint8 arrays of shape (height, width, 3). Opens a hidden window if none is open
+    max_ticks: end episodes after this many ticks even if the game isn't over
+    """
+    def __init__(self, render_size=None, max_ticks=None):
+        self.render_size = render_size
+        self.max_ticks = max_ticks
+        self.game = None
+        self.scores = HighScoreStore(None)  # Training games stay out of the player's high scores
+        if render_size is not None and pygame.display.get_surface() is None:
+            pygame.display.set_mode(WINDOW_SIZE, pygame.HIDDEN)
+
+    def reset(self, seed=None):
+        """Start a new game, the same seed and actions replay the same episode, returns the first observation"""
+        if self.game is None:
+            self.game = Game(headless=self.render_size is None, seed=seed, clock=VirtualClock(),
+                             scores=self.scores)
+        else:
+            # Keeps the window, fonts and orb texture, only the simulation starts over
+            self.game.reset(seed, VirtualClock())
+        return self.observe()
+
+    def step(self, action):
+        """
+        Advance one tick with a paddle move amount (clipped to +-PADDLE_SPEED)
+        Returns (observation, reward, done, info), rewards are +1 per paddle hit and -1 per lost life
+        """
+        game = self.game
+        if game.game_over:
+            return self.observe(), 0.0, True, self.info()
+        lives = game.lives
+        paddle_hits = game.paddle_hits
+        game.update(max(-PADDLE_SPEED, min(PADDLE_SPEED, float(action))))
+        reward = float(game.paddle_hits - paddle_hits - max(0, lives - game.lives))
+        done = game.game_over or (self.max_ticks is not None and game.ticks >= self.max_ticks)
+        return self.observe(), reward, done, self.info()
+
+    def info(self):
+        return {'score': self.game.score, 'level': self.game.level, 'ticks': self.game.ticks}
+
+    def observe(self):
+        game = self.game
+        if self.render_size is not None:
+            surface_pool.begin_frame()  # Scratch surfaces from the last observation go back to the pool
+            game.draw()
+            frame = pygame.transform.smoothscale(game.screen, self.render_size)
+            return pygame.surfarray.array3d(frame).transpose(1, 0, 2)
+        ball, snake = game.ball, game.snakes[0]
+        return observation(numpy.array([ball.pos], dtype=float), numpy.array([ball.vel], dtype=float),
+                           snake.side, snake.progress, snake.velocity, ball.moving_inward,
+                           game.countdown_active or game.level_transition)[0]
+
+class RolloutBuffer:
+    """
+    Observations, actions, rewards and done flags of many episodes, in shared memory so rollout
+    workers write them in place instead of pickling them back. Row i holds episode i, and
+    lengths[i] is how many of its max_ticks steps were played
+    """
+    def __init__(self, episodes, max_ticks, obs_shape, obs_dtype, names=None):
+        """names: shared memory block per field, to attach to a buffer made in another process"""
+        self.spec = (episodes, max_ticks, tuple(obs_shape), numpy.dtype(obs_dtype).str)
+        self.owner = names is None
+        self.blocks = {}
+        for field, (shape, dtype) in self.fields().items():
+            if self.owner:
+                size = max(1, int(numpy.prod(shape)) * numpy.dtype(dtype).itemsize)
+                block = SharedMemory(create=True, size=size)
+            else:
+                block = SharedMemory(name=names[field])
+            self.blocks[field] = block
+            setattr(self, field, numpy.ndarray(shape, dtype, buffer=block.buf))
+
+    def fields(self):
+        """Field name -> (shape, dtype)"""
+        episodes, max_ticks, obs_shape, obs_dtype = self.spec
+        return {
+            'obs': ((episodes, max_ticks) + obs_shape, obs_dtype),  # Observation each action was chosen from
+            'actions': ((episodes, max_ticks), numpy.float32),
+            'rewards': ((episodes, max_ticks), numpy.float32),
+            'dones': ((episodes, max_ticks), bool),
+            'lengths': ((episodes,), numpy.int64),
+        }
+
+    @property
+    def names(self):
+        return {field: block.name for field, block in self.blocks.items()}
+
+    def close(self):
+        """Detach from the shared memory, and free it in the process that made the buffer"""
+        for field, block in self.blocks.items():
+            delattr(self, field)  # The arrays must go before their memory can
+            block.close()
+            if self.owner:
+                block.unlink()
+        self.blocks = {}
+
+# Per-process state of a rollout worker, set up once by attach_worker
+worker = {}
+
+def attach_worker(spec, names, policy, render_size, max_ticks):
+    """Pool initializer: attach to the rollout buffer and make the worker's environment"""
+    # pygame.init() lets SDL catch SIGTERM, which would keep Pool.terminate() from stopping the worker
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    worker['buffer'] = RolloutBuffer(*spec, names=names)
+    worker['policy'] = policy
+    worker['env'] = PongEnv(render_size, max_ticks)
+
+def run_episode(task):
+    """Pool task: play one (episode index, seed) into the shared buffer, returns the episode index"""
+    index, seed = task
+    buffer, policy, env = worker['buffer'], worker['policy'], worker['env']
+    obs = env.reset(seed)
+    done = False
+    tick = 0
+    while not done:
+        action = policy(obs)
+        buffer.obs[index, tick] = obs
+        obs, reward, done, info = env.step(action)
+        buffer.actions[index, tick] = action
+        buffer.rewards[index, tick] = reward
+        buffer.dones[index, tick] = done
+        tick += 1
+    buffer.lengths[index] = tick
+    return index
+
+def run_rollouts(policy, episodes, max_ticks, processes=None, seed=0, render_size=None, buffer=None):
+    """
+    Play episodes PongEnv games on a pool of processes (one per core by default), returns the RolloutBuffer
+    policy: callable from an observation to a paddle move, picklable (e.g. a module level function)
+    max_ticks: ticks per episode at most, longer games are cut off there
+    seed: episode i plays the game seeded with seed + i, whatever the number of processes
+    buffer: a buffer from an earlier call with the same sizes to fill again, call close() when done with it
+    """
+    made_buffer = buffer is None
+    if made_buffer:
+        buffer = RolloutBuffer(episodes, max_ticks, *observation_spec(render_size))
+    try:
+        with multiprocessing.Pool(processes, initializer=attach_worker,
+                                  initargs=(buffer.spec, buffer.names, policy, render_size, max_ticks)) as pool:
+            for _ in pool.imap_unordered(run_episode, ((i, seed + i) for i in range(episodes))):
+                pass
+    except BaseException:
+        if made_buffer:
+            buffer.close()  # Nobody else can free it
+        raise
+    return buffer